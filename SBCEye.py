@@ -41,18 +41,26 @@ import time
 import sys
 import logging
 import random
+from itertools import count
 from datetime import timedelta
 from logging.handlers import RotatingFileHandler
 from atexit import register
 from signal import signal, SIGTERM, SIGINT, SIGHUP
-from multiprocessing import Process, Queue
-import schedule
+from multiprocessing import Process
+from threading import Condition
 import psutil
 
 # Local classes
 from load_config import Settings
 from robin import Robin
-from httpserver import serve_http
+from recent import Recent
+from events import EventHub
+from metrics import Metrics
+from procsampler import ProcSampler, PsutilSampler
+from timers import scheduler
+from collectors import Collectors
+from stagetimes import StageTimes
+from httpserver import serve_http, format_reading
 from netreader import Netreader
 from pinreader import Pinreader
 from bus_drivers import i2c_setup
@@ -124,28 +132,64 @@ if settings.button_out > 0:
 #
 # Local Classes, Globals
 
-display_queue = None  # will be set during
+COLLECT_TIMEOUT = 5  # seconds, for the system and sensor collectors
+snapshot = None  # shared memory readings for the display, set during init
+recent = None  # ring buffers of recent readings, set during init
+events = None  # live readings for the web clients, set during init
+metrics = None  # prometheus metrics, set during init
+stage_times = None  # durations of the collection stages, set during init
+cycles_over = 0  # consecutive collection cycles over the time budget
 class TheData(dict):
-    '''Override the dictionary class to also send data to the queue for the display'''
+    '''Override the dictionary class to also record readings in the recent ring buffers
+
+    The generation attribute changes whenever the data changes, so that
+    anything derived from the data (eg web pages) can be cached against it
+    The cycle attribute counts completed data updates, clients can wait for
+    the next one with wait_cycle()'''
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.counter = count(1)
+        self.generation = 0
+        self.cycle = 0
+        self.cycled = Condition()
     def __setitem__(self, item, value):
-        if display_queue:
-            display_queue.put([item, value])
+        if recent:
+            recent.record(item, value)
         super().__setitem__(item, value)
+        self.generation = next(self.counter)
     def __delitem__(self, item):
-        if display_queue:
-            display_queue.put([item], None)
         super().__delitem__(item)
+        self.generation = next(self.counter)
+    def complete_cycle(self):
+        '''Mark the end of a data update, waking anything waiting for it'''
+        with self.cycled:
+            self.cycle += 1
+            self.cycled.notify_all()
+    def wait_cycle(self, cycle, timeout):
+        '''Wait up to (timeout) seconds for a data update after (cycle)
+        returns the latest cycle'''
+        with self.cycled:
+            self.cycled.wait_for(lambda: self.cycle > cycle, timeout)
+            return self.cycle
 
 # Use a (custom overridden) dictionary to store current readings
 data = TheData({})
 
+# System readings are sampled directly from /proc where possible
+try:
+    sampler = ProcSampler()
+    logging.info('System readings sampled from /proc')
+except OSError:
+    sampler = PsutilSampler()
+    logging.info('System readings sampled via psutil')
+
 # Counters used for incremental data need pre-populating
 counter = {}
-counter["sys-net-io"] = psutil.net_io_counters().bytes_sent \
-        + psutil.net_io_counters().bytes_recv
-counter["sys-disk-io"] = psutil.disk_io_counters().read_bytes\
-        + psutil.disk_io_counters().write_bytes
-counter["sys-cpu-int"] = psutil.cpu_stats().soft_interrupts
+initial = sampler.sample()
+counter["sys-net-io"] = initial["net"]
+counter["sys-disk-io"] = initial["disk"]
+counter["sys-cpu-int"] = initial["soft_interrupts"]
+counter["time"] = time.time()
 data["update-time"] = time.time() # time of last update
 
 
@@ -176,7 +220,7 @@ def button_control(action="toggle"):
     else:
         state = False
         ret = 'Not supported, no output pin defined'
-    pins.update_pins()
+    update_pins()
     return (ret, state)
 
 def button_interrupt(*_):
@@ -187,46 +231,85 @@ def button_interrupt(*_):
         logging.info('Button pressed')
         button_control()
 
-def update_system():
-    '''Get current environmental and system data, called on a schedule
+def update_system(readings):
+    '''Get current system data, run by the collectors
     '''
-    data['sys-temp'] = psutil.sensors_temperatures()[cpu_thermal_device][0].current
-    data['sys-load'] = psutil.getloadavg()[0]
-    data["sys-freq"] = psutil.cpu_freq().current
-    data['sys-mem'] = psutil.virtual_memory().percent
-    data["sys-disk"] = psutil.disk_usage('/').percent
-    data["sys-proc"] = len(psutil.pids())
-    net_count = psutil.net_io_counters().bytes_sent \
-            + psutil.net_io_counters().bytes_recv
-    disk_count = psutil.disk_io_counters().read_bytes\
-            + psutil.disk_io_counters().write_bytes
-    int_count = psutil.cpu_stats().soft_interrupts
-    time_period = time.time() - data["update-time"]
-    data["update-time"] = time.time()
-    data["sys-net-io"] = (net_count - counter["sys-net-io"]) / time_period / 1000
-    data["sys-disk-io"] = (disk_count - counter["sys-disk-io"]) / time_period / 1000
-    data["sys-cpu-int"] = (int_count - counter["sys-cpu-int"]) / time_period
+    sample = sampler.sample()
+    readings['sys-temp'] = psutil.sensors_temperatures()[cpu_thermal_device][0].current
+    readings['sys-load'] = sample['load']
+    readings["sys-freq"] = psutil.cpu_freq().current
+    readings['sys-mem'] = sample['mem']
+    readings["sys-disk"] = psutil.disk_usage('/').percent
+    readings["sys-proc"] = sample['procs']
+    net_count = sample['net']
+    disk_count = sample['disk']
+    int_count = sample['soft_interrupts']
+    time_period = time.time() - counter["time"]
+    counter["time"] = time.time()
+    readings["sys-net-io"] = (net_count - counter["sys-net-io"]) / time_period / 1000
+    readings["sys-disk-io"] = (disk_count - counter["sys-disk-io"]) / time_period / 1000
+    readings["sys-cpu-int"] = (int_count - counter["sys-cpu-int"]) / time_period
     counter["sys-net-io"] = net_count
     counter["sys-disk-io"] = disk_count
     counter["sys-cpu-int"] = int_count
 
-def update_sensors():
-    '''Get current environmental sensor data
+def update_sensors(readings):
+    '''Get current environmental sensor data, run by the collectors
     '''
-    if bme280:
-        data['env-temp'] = bme280.temperature
-        data['env-humi'] = bme280.relative_humidity
-        data['env-pres'] = bme280.pressure
-        # Failed pressure measurements really foul up the graph, skip
-        if data['env-pres'] == 0:
-            data['env-pres'] = 'U'
+    readings['env-temp'] = bme280.temperature
+    readings['env-humi'] = bme280.relative_humidity
+    readings['env-pres'] = bme280.pressure
+    # Failed pressure measurements really foul up the graph, skip
+    if readings['env-pres'] == 0:
+        readings['env-pres'] = 'U'
 
 def update_data():
-    '''Runs on a scedule, refresh readings and update RRD'''
-    update_sensors()
-    update_system()
-    net.update(data)
-    rrd.update(data)
+    '''Runs on a scedule, records the latest readings from the collectors in the RRD'''
+    # Timestamp the readings when the update was due, not when it completes
+    timestamp = int(time.time())
+    collectors.check()
+    data["update-time"] = time.time()
+    stage_times.publish(data)
+    (cached, flushed) = rrd.update(collectors.snapshot(), timestamp)
+    stage_times.record('rrd-cache', cached)
+    if flushed is not None:
+        stage_times.record('rrd-flush', flushed)
+    # The collectors run in parallel, so a cycle takes as long as the slowest
+    cycle = max((stats['duration'] for stats in collectors.stats().values()), default=0)
+    check_cycle(cycle + cached + (flushed or 0))
+    if snapshot:
+        snapshot.write(data)
+    if events:
+        events.publish(data)
+    if metrics:
+        metrics.render(data)
+    data.complete_cycle()
+
+def update_pins():
+    '''Runs on a schedule, check the pins and publish any changes'''
+    start = time.monotonic()
+    pins.update_pins()
+    stage_times.record('pins', time.monotonic() - start)
+    if events:
+        events.publish(data)
+    if metrics:
+        metrics.render(data)
+
+def check_cycle(seconds):
+    '''Record the collection cycle time, and warn when it is over budget'''
+    global cycles_over  # pylint: disable=global-statement
+    stage_times.record('cycle', seconds)
+    budget = settings.cycle_warn * settings.data_interval
+    if budget <= 0:
+        return
+    if seconds > budget:
+        if cycles_over == 0:
+            logging.warning(f'Collection cycle took {seconds:.2f}s, over '\
+                    f'{settings.cycle_warn:.0%} of the {settings.data_interval}s data interval')
+        cycles_over += 1
+    elif cycles_over:
+        logging.info(f'Collection cycle back within budget after {cycles_over} slow cycles')
+        cycles_over = 0
 
 def hourly():
     '''Remind everybody we are alive'''
@@ -235,6 +318,27 @@ def hourly():
     uptime = timedelta(seconds=int(time.time() - psutil.boot_time()))
     logging.info(f'{settings.name} :: up {uptime}')
     print(f'{myself} :: {timestamp} :: {settings.name} :: up {uptime}')
+    if rrd.graph_cache:
+        stats = rrd.graph_cache.stats()
+        print(f'Graph cache :: {stats["entries"]} graphs, {stats["bytes"]} bytes, '\
+                f'hits: {stats["hits"]}, misses: {stats["misses"]}, '\
+                f'evictions: {stats["evictions"]}')
+    stats = rrd.render_pool.stats()
+    print(f'Render pool :: {stats["completed"]} renders, {stats["rejected"]} rejected, '\
+            f'queue: {stats["waiting"]}/{stats["queue"]}, '\
+            f'wait mean: {stats["wait_mean"]:.3f}s, max: {stats["wait_max"]:.3f}s')
+    for name, stats in timers.stats().items():
+        print(f'Schedule :: {name}: {stats["runs"]} runs, {stats["missed"]} missed, '\
+                f'late mean: {stats["late_mean"]:.3f}s, max: {stats["late_max"]:.3f}s')
+    for stage in stage_times.times:
+        stats = stage_times.stats(stage)
+        if stats:
+            print(f'Stage time :: {stage}: p50: {stats["p50"]:.3f}s, '\
+                    f'p95: {stats["p95"]:.3f}s, max: {stats["max"]:.3f}s')
+    for name, stats in collectors.stats().items():
+        print(f'Collector :: {name}: {stats["runs"]} runs, {stats["skipped"]} skipped, '\
+                f'{stats["timeouts"]} timeouts, {stats["errors"]} errors, '\
+                f'last: {stats["duration"]:.3f}s')
 
 def handle_signal(sig, *_):
     '''Handle common signals'''
@@ -292,9 +396,10 @@ if __name__ == '__main__':
 
     # Display animation setup
     if disp:
-        from animator import animate
-        display_queue = Queue()
-        DISPLAY = Process(target=animate, args=(settings, disp, display_queue),
+        from animator import animate, DISPLAY_KEYS
+        from snapshot import DataSnapshot
+        snapshot = DataSnapshot(DISPLAY_KEYS)
+        DISPLAY = Process(target=animate, args=(settings, disp, snapshot),
                 name='sbceye_animator')
         DISPLAY.start()
     else:
@@ -309,23 +414,56 @@ if __name__ == '__main__':
     else:
         print()
 
-    # Populate initial system data
-    update_system()
+    # Timings of each collection stage are kept, and recorded as readings
+    stages = ['cycle', 'system']
+    if bme280:
+        stages.append('sensors')
+    if settings.net_map:
+        stages.append('net')
+    stages += ['rrd-cache', 'rrd-flush']
+    if settings.pin_map:
+        stages.append('pins')
+    stage_times = StageTimes(stages, settings.stage_window, settings.stage_window > 0)
+
+    # Data collectors run in parallel, each on its own interval
+    collectors = Collectors(data, stage_times)
+    collectors.add('system', update_system, settings.system_interval, COLLECT_TIMEOUT)
+    if bme280:
+        collectors.add('sensors', update_sensors, settings.sensors_interval, COLLECT_TIMEOUT)
 
-    # Populate initial sensor data
-    update_sensors()
+    # Populate initial system and sensor data
+    collectors.collect()
 
     # Network (ping) monitoring
     net = Netreader((settings.net_map, settings.net_timeout), data)
+    if settings.net_map:
+        collectors.add('net', net.update, settings.net_interval, settings.net_timeout + 1)
 
     # GPIO Pin monitoring
     pins = Pinreader((settings.pin_map, settings.pin_state_names), data)
 
     # RRD init now that the data{} structure is populated
+    stage_times.publish(data)
     rrd = Robin(settings, data)
 
+    # In-memory buffers of recent readings for the active sources
+    if settings.web_recent > 0:
+        recent = Recent(rrd.sources, settings.web_recent)
+        print(f'Recent readings buffer: {settings.web_recent} readings per source, '\
+                f'{recent.size()} bytes')
+        logging.info(f'Recent readings buffer uses {recent.size()} bytes')
+
+    # Changed readings are pushed to web clients as they happen
+    if settings.web_events > 0:
+        events = EventHub(lambda key, value: format_reading(settings, key, value),
+                settings.web_events)
+
+    # Prometheus metrics are rendered once per update
+    if settings.web_metrics:
+        metrics = Metrics(rrd, stage_times.latest)
+
     # Start the web server, it will fork into a seperate thread and run continually
-    serve_http(settings, rrd, data, (button_control,))
+    serve_http(settings, rrd, data, (button_control,), recent, events, metrics)
 
     # Exit handlers (needed for rrd cache write on shutdown)
     signal(SIGTERM, handle_signal)
@@ -334,22 +472,22 @@ if __name__ == '__main__':
     register(handle_exit)
 
     # Schedule pin monitoring, database updates and logging events
+    timers = scheduler(settings.scheduler)
     if settings.log_hourly:
-        schedule.every().hour.at(":00").do(hourly)
-    schedule.every(settings.data_interval).seconds.do(update_data)
+        timers.hourly(hourly)
+    collectors.start(timers)
+    timers.every(settings.data_interval, update_data, align=True)
     if len(settings.pin_map.keys()) > 0:
-        schedule.every(settings.pin_interval).seconds.do(pins.update_pins)
+        timers.every(settings.pin_interval, update_pins)
 
     # We got this far... time to start the show
     logging.info("Init complete, starting schedules and entering service loop")
 
     # Run all the schedule jobs once, so we have data ready to serve
-    schedule.run_all()
+    timers.run_all()
 
     # Start the backup schedule after the run_all()
-    rrd.start_backups()
+    rrd.start_backups(timers)
 
     # Main loop now runs forever while servicing the scheduler
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    timers.run()
@@ -0,0 +1,167 @@
+'''asyncio HTTP/1.1 server for the SBCEye project
+
+provides:
+    AsyncHTTPServer: serves an http.server request handler class from an
+        asyncio event loop, with keep-alive, a connection limit and timeouts
+
+Connections (and idle keep-alive connections) are held by the event loop,
+not by threads. Each request is handed, once its headers have arrived, to
+the unmodified request handler running on a fixed pool of worker threads,
+so all the blocking work (rendering, dumping, log reading) happens off the
+event loop and the routes are exactly those of the threaded server.
+'''
+
+# pragma pylint: disable=logging-fstring-interpolation
+
+import asyncio
+import logging
+from io import BytesIO
+from concurrent.futures import TimeoutError as FutureTimeout
+from threading import Thread
+
+# Local classes
+from workers import Workers
+
+BUSY = b'HTTP/1.1 503 Service Unavailable\r\nContent-Type: text/plain\r\n'\
+        b'Content-Length: 34\r\nRetry-After: 5\r\nConnection: close\r\n\r\n'\
+        b'Server busy, please retry shortly\n'
+
+class _TransportWriter:
+    '''File-like object used as the handler wfile, writes are passed to the
+    event loop and block the worker until the client has accepted them'''
+
+    def __init__(self, loop, writer, timeout):
+        self.loop = loop
+        self.writer = writer
+        self.timeout = timeout
+
+    async def _write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def write(self, data):
+        '''Write data to the client, raises ConnectionResetError if it stalls'''
+        future = asyncio.run_coroutine_threadsafe(self._write(data), self.loop)
+        try:
+            future.result(self.timeout)
+        except FutureTimeout as timeout:
+            future.cancel()
+            raise ConnectionResetError('Write timed out') from timeout
+        return len(data)
+
+    def flush(self):
+        '''Writes are unbuffered'''
+
+class _AsyncHandler:
+    '''Mixin that runs a http.server request handler on a single request
+    whose head has already been read, rather than on a socket'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def __init__(self, head, wfile, client_address, server):
+        self.rfile = BytesIO(head)
+        self.wfile = wfile
+        super().__init__(None, client_address, server)
+
+    def setup(self):
+        '''rfile and wfile are supplied, not made from a socket'''
+
+    def handle(self):
+        '''Process just the one request'''
+        self.close_connection = True
+        self.handle_one_request()
+
+    def finish(self):
+        '''Nothing to flush or close, the connection outlives the request'''
+
+class AsyncHTTPServer:
+    '''HTTP server running in its own thread and asyncio event loop
+
+    parameters:
+        address: (tuple) host and port to bind to
+        handler: (class) a http.server.BaseHTTPRequestHandler subclass
+        limits: (tuple) consisting of:
+            connections: (int) maximum simultaneous connections, further
+                connections get an immediate '503 busy' response
+            timeout: (int) seconds allowed to receive a request head or for
+                the client to accept a write
+            keepalive: (int) seconds an idle connection is kept open
+
+    provides:
+        start(): bind and serve in a background thread
+        server_name, server_port: the address being served
+    '''
+
+    def __init__(self, address, handler, limits):
+        self.address = address
+        self.handler = type(f'Async{handler.__name__}', (_AsyncHandler, handler), {})
+        (self.max_connections, self.timeout, self.keepalive) = limits
+        self.connections = 0
+        # One worker per connection, so a long lived stream never starves the rest
+        self.executor = Workers(self.max_connections, 'sbceye_http')
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.server_name = address[0] or 'localhost'
+        self.server_port = address[1]
+
+    def start(self):
+        '''Bind to the address, then run the event loop in a daemon thread'''
+        self.server = self.loop.run_until_complete(asyncio.start_server(
+                self._connection, self.address[0] or None, self.address[1],
+                reuse_address=True))
+        self.server_port = self.server.sockets[0].getsockname()[1]
+        thread = Thread(target=self._run, name='sbceye_http_loop', daemon=True)
+        thread.start()
+
+    def _run(self):
+        logging.info("Async Http Server starting")
+        try:
+            self.loop.run_forever()
+        finally:
+            logging.info("Async Http Server closing down")
+
+    async def _connection(self, reader, writer):
+        '''Serve requests on a connection until it closes, times out or the
+        handler asks for it to be closed'''
+        if self.connections >= self.max_connections:
+            writer.write(BUSY)
+            await self._close(writer)
+            return
+        self.connections += 1
+        peer = writer.get_extra_info('peername')
+        try:
+            timeout = self.timeout
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                        asyncio.LimitOverrunError, ConnectionError):
+                    break
+                try:
+                    keep = await self.loop.run_in_executor(self.executor,
+                            self._handle, head, writer, peer)
+                except ConnectionError:
+                    break
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception(f'Error handling request from {peer}')
+                    break
+                if not keep:
+                    break
+                timeout = self.keepalive
+        finally:
+            self.connections -= 1
+            await self._close(writer)
+
+    def _handle(self, head, writer, peer):
+        '''Runs on a worker, handles one request
+        returns True if the connection can be kept open'''
+        handler = self.handler(head, _TransportWriter(self.loop, writer, self.timeout),
+                peer, self)
+        return not handler.close_connection
+
+    async def _close(self, writer):
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
@@ -5,15 +5,15 @@ part of the SBCEye Project
 # pragma pylint: disable=logging-fstring-interpolation
 
 # Some general functions we will use
-from time import sleep, time
+from time import time
 import logging
 from sys import exit as sys_exit
 from signal import signal, SIGTERM, SIGINT
-import schedule
 from PIL import Image, ImageDraw, ImageFont
 
 # Local classes
 from saver import Saver
+from timers import scheduler
 
 # Unicode degrees character
 DEGREE_SIGN = u'\N{DEGREE SIGN}'
@@ -41,6 +41,9 @@ FRAME_MAP = {
             },
         }
 
+# Readings used by the display, these are given slots in the shared snapshot
+DISPLAY_KEYS = ['update-time'] + [key for rows in FRAME_MAP.values() for key in rows]
+
 class Animator:
     '''Animates the I2C OLED display
 
@@ -50,8 +53,8 @@ class Animator:
     A screensaver can be invoked to blank or invert the display as the user wishes
     '''
 
-    def __init__(self, settings, disp, data):
-        '''Display setup'''
+    def __init__(self, settings, disp, data, timers):
+        '''Display setup, animation and screensaver jobs are added to (timers)'''
         self.disp = disp
         self.data = data
 
@@ -88,15 +91,15 @@ class Animator:
         self.passes = settings.animate_passes
         self.current_pass = -2
         self.current_frame = 0
-        schedule.every(settings.animate_passtime).seconds.do(self._frame)
-        schedule.every().hour.at(":00").do(self._hourly)
+        timers.every(settings.animate_passtime, self._frame)
+        timers.hourly(self._hourly)
 
         # Start saver
         saver_settings = (settings.saver_mode, settings.saver_on,
                 settings.saver_off, settings.display_invert)
         self.screensaver = Saver(disp, saver_settings)
         self.screensaver.check()
-        schedule.every().hour.at(":00").do(self.screensaver.check)
+        timers.hourly(self.screensaver.check, 'saver')
 
         # Notify logs etc
         logging.info('Display configured and enabled')
@@ -214,8 +217,8 @@ class Animator:
         self._splash()
 
 
-def animate(settings, disp, queue):
-    '''Runs in a subprocess, animate the display using data recieved on the queue
+def animate(settings, disp, snapshot):
+    '''Runs in a subprocess, animate the display using data from the shared snapshot
 
     This function is called as a subprocess and is not expected to return.
     It starts the main Animator class, which animates the display and is driven
@@ -223,13 +226,13 @@ def animate(settings, disp, queue):
     The screensaver is driven by another schedule as needed
 
     Having started the Animator class this function enters an infinite loop
-    servicing the schedule(s) once per second. It listens on a queue
-    for incoming data pairs, and updates the values it displays.
+    servicing the schedule(s). When the main process signals new data it
+    reads a consistent copy of the readings from the shared snapshot.
 
     parameters:
         settings: main SBCEye settings class
         disp:     display module object
-        queue:    multiprocess queue, used to recieve data updates
+        snapshot: DataSnapshot, shared memory holding the latest readings
 
     returns:
         Nothing, enters a loop and is not expected to return
@@ -253,15 +256,13 @@ def animate(settings, disp, queue):
 
     # Start the animator
     data = {"update-time": time()}
-    animation = Animator(settings, disp, data)
+    timers = scheduler(settings.scheduler, 0.25)
+    animation = Animator(settings, disp, data, timers)
 
-    # Loop forever servicing scheduler and queue
+    # Loop forever servicing scheduler and waiting for data until the next job is due
     while animation:
-        while not queue.empty():
-            key, value = queue.get_nowait()
-            if value is not None:
-                data.update({key: value})
-            else:
-                data.pop(key, None)
-        schedule.run_pending()
-        sleep(0.25)
+        if snapshot.wait(timers.run_pending()):
+            readings = snapshot.read()
+            if readings is not None:
+                data.clear()
+                data.update(readings)
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+'''Compare in-process (bindings) vs commandline (forked) rrdtool graph rendering
+
+Builds a throwaway database populated with a day of random 10s readings and
+renders the same graph repeatedly via both paths, reporting per-graph latency
+and the CPU consumed (including any forked children).
+
+usage:
+    python benchmarks/graph_render.py [renders]
+'''
+
+import sys
+import time
+import random
+import resource
+import subprocess
+from shutil import which
+from tempfile import TemporaryDirectory
+import rrdtool
+
+SOURCES = ['sys-temp', 'sys-load', 'sys-mem']
+
+def _build_db(db_file):
+    '''Create and populate a test database with one day of data'''
+    now = int(time.time())
+    start = now - 86400
+    rrdtool.create(db_file, '--start', str(start - 10), '--step', '10s',
+            *[f'DS:{source}:GAUGE:60:U:U' for source in SOURCES],
+            'RRA:AVERAGE:0.5:1:181440',
+            'RRA:AVERAGE:0.5:6:133920',
+            'RRA:AVERAGE:0.5:360:158112')
+    lines = []
+    for stamp in range(start, now, 10):
+        lines.append(f'{stamp}:' + ':'.join(f'{random.uniform(0, 100):.2f}'
+                for _ in SOURCES))
+        if len(lines) == 500:
+            rrdtool.update(db_file, *lines)
+            lines = []
+    if lines:
+        rrdtool.update(db_file, *lines)
+
+def _graph_args(db_file):
+    '''A representative set of graph arguments, similar to Robin.draw_graph()'''
+    return ['--full-size-mode', '--start', 'end-1d', '--end', 'now',
+            '--width', '1200', '--height', '300',
+            '--title', 'CPU Temperature: -1d >> now',
+            '--left-axis-format', '%3.0lf',
+            f'DEF:data={db_file}:sys-temp:AVERAGE',
+            'AREA:data#D0E0E0#FFFFFF:gradheight=0',
+            'LINE2:data#00A0A0:benchmark',
+            r'GPRINT:data:MIN:Min\:%3.1lf',
+            r'GPRINT:data:AVERAGE:Average\:%3.1lf',
+            r'GPRINT:data:MAX:Max\:%3.1lf',
+            r'GPRINT:data:LAST:Last\:%3.1lf']
+
+def _cpu():
+    '''CPU seconds used by this process and its reaped children'''
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + kids.ru_utime + kids.ru_stime
+
+def _run(name, render, count):
+    '''Time (count) renders and print the results'''
+    render()  # warm up caches
+    wall = time.perf_counter()
+    cpu = _cpu()
+    size = 0
+    for _ in range(count):
+        size = len(render())
+    wall = (time.perf_counter() - wall) / count
+    cpu = (_cpu() - cpu) / count
+    print(f'{name:>12}: {wall * 1000:7.1f}ms/graph wall, '\
+            f'{cpu * 1000:7.1f}ms/graph cpu, {size} bytes')
+
+def main(count=20):
+    '''Run the comparison'''
+    with TemporaryDirectory() as tmp:
+        db_file = f'{tmp}/bench.rrd'
+        _build_db(db_file)
+        args = _graph_args(db_file)
+        print(f'Rendering {count} graphs per method')
+        _run('in-process', lambda: rrdtool.graphv('-', *args)['image'], count)
+        cli = which('rrdtool')
+        if cli:
+            _run('commandline', lambda: subprocess.check_output(
+                    [cli, 'graph', '-', *args]), count)
+        else:
+            print('No commandline rrdtool available, fork path not measured')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+'''Compare the threaded (HTTP/1.0, thread per connection) and the async
+(HTTP/1.1 keep-alive, worker pool) web servers
+
+Both servers run the same handler, which returns a fixed 4Kb page, so only
+the connection and threading overheads are measured. A number of clients
+each make a series of requests, reusing their connection where the server
+allows it, and the request rate, latency and server CPU time are reported.
+
+usage:
+    python benchmarks/http_server.py [clients] [requests per client]
+'''
+
+import os
+import sys
+import time
+import resource
+import http.server
+import http.client
+from threading import Thread
+from statistics import mean, quantiles
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from aioserver import AsyncHTTPServer  # pylint: disable=wrong-import-position
+
+PAGE = b'<html><body>' + b'x' * 4096 + b'</body></html>'
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    '''A fixed page, with a length so that connections can be kept open'''
+    def do_GET(self):  # pylint: disable=invalid-name
+        '''The page'''
+        self.send_response(200)
+        self.send_header("Content-type", "text/html")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *_):
+        '''Quiet'''
+
+def _start_threaded():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd.server_port
+
+def _start_async(clients):
+    httpd = AsyncHTTPServer(('127.0.0.1', 0), _Handler, (clients, 30, 15))
+    httpd.start()
+    return httpd.server_port
+
+def _client(port, requests, latencies):
+    '''Make (requests) GETs, reconnecting whenever the server closes'''
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    for _ in range(requests):
+        start = time.perf_counter()
+        connection.request('GET', '/')
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        if response.will_close:
+            connection.close()
+    connection.close()
+
+def _run(name, port, clients, requests):
+    '''Run the clients against a server and report'''
+    latencies = []
+    cpu = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    threads = [Thread(target=_client, args=(port, requests, latencies))
+            for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    used = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_time = (used.ru_utime - cpu.ru_utime) + (used.ru_stime - cpu.ru_stime)
+    print(f'{name:>9}: {len(latencies) / elapsed:8.0f} req/s, '\
+            f'latency mean {mean(latencies) * 1000:6.2f}ms, '\
+            f'p95 {quantiles(latencies, n=20)[-1] * 1000:6.2f}ms, '\
+            f'cpu {cpu_time * 1000 / len(latencies):5.3f}ms/req (clients included)')
+
+def main():
+    '''Benchmark both servers'''
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    print(f'{clients} clients x {requests} requests, {len(PAGE)} byte page')
+    _run('threaded', _start_threaded(), clients, requests)
+    _run('async', _start_async(clients), clients, requests)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+'''Compare the cost of sampling the system readings via psutil and /proc
+
+Times the original psutil calls made by update_system() (including the
+duplicated counter calls), the PsutilSampler and the ProcSampler, reporting
+the wall and CPU time per sample.
+
+usage:
+    python benchmarks/system_sample.py [samples]
+'''
+
+import os
+import sys
+import time
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from procsampler import ProcSampler, PsutilSampler  # pylint: disable=wrong-import-position
+
+def _original():
+    '''The readings as update_system() used to gather them'''
+    return {
+            'load': psutil.getloadavg()[0],
+            'mem': psutil.virtual_memory().percent,
+            'procs': len(psutil.pids()),
+            'net': psutil.net_io_counters().bytes_sent + psutil.net_io_counters().bytes_recv,
+            'disk': psutil.disk_io_counters().read_bytes
+                + psutil.disk_io_counters().write_bytes,
+            'soft_interrupts': psutil.cpu_stats().soft_interrupts,
+            }
+
+def _time(name, func, samples):
+    '''Run func (samples) times and report'''
+    func()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for _ in range(samples):
+        func()
+    wall = (time.perf_counter() - wall) / samples
+    cpu = (time.process_time() - cpu) / samples
+    print(f'{name:>14}: {wall * 1e6:8.1f}us wall, {cpu * 1e6:8.1f}us cpu per sample')
+
+def main():
+    '''Benchmark the three ways of sampling'''
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f'{samples} samples')
+    _time('psutil (old)', _original, samples)
+    _time('PsutilSampler', PsutilSampler().sample, samples)
+    _time('ProcSampler', ProcSampler().sample, samples)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+'''Parallel data collection for the SBCEye project
+
+provides:
+    Collectors: a registry of data collectors, each run on its own interval
+        in a small thread pool and publishing its readings when it finishes
+'''
+
+# pragma pylint: disable=logging-fstring-interpolation
+
+import time
+import logging
+from concurrent.futures import wait
+from threading import Lock
+
+# Local classes
+from workers import Workers
+
+class _Collector:
+    '''A registered collector and its counters'''
+
+    def __init__(self, name, func, interval, timeout):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.timeout = timeout
+        self.future = None
+        self.started = 0.0
+        self.keys = set()  # keys published by the latest run
+        self.overrun = False
+        self.runs = 0
+        self.skipped = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.duration = 0.0
+
+    def stats(self):
+        '''Counters, as a dict'''
+        return {'runs': self.runs, 'skipped': self.skipped, 'timeouts': self.timeouts,
+                'errors': self.errors, 'duration': self.duration}
+
+class Collectors:
+    '''Run the data collectors in parallel, each on its own interval
+
+    Each collector is a function that fills a dict with its readings, these
+    are published into data{} together when it finishes. Collectors run on
+    a pool with a thread for each, so a slow sensor or ping cannot delay the
+    others or the database updates, which sample the latest readings on their
+    own schedule. Collectors are started (timeout) seconds before each aligned
+    interval, so that they have finished by the time the readings are
+    sampled, and each publishes its readings as one locked batch so that a
+    snapshot() never mixes readings from two runs of a collector. A collector
+    that raises an exception has its readings marked unknown ('U'). A
+    collector that is still running when it is next due is skipped; once it
+    has run for longer than its timeout this is logged and its readings are
+    marked unknown ('U') until it recovers.
+
+    parameters:
+        data: the main data{} dictionary, readings are published into it
+        timings: StageTimes, the duration of each run is recorded under the
+            collector name
+
+    provides:
+        add(name, func, interval, timeout): register func(readings) to run
+            every (interval) seconds, with a (timeout) in seconds
+        start(timers): schedule the collectors with the scheduler (timers)
+        collect(): run all the collectors now, and wait for them (up to their
+            timeouts) to finish
+        check(): detect and log collectors that have exceeded their timeout
+        snapshot(): returns a consistent copy of data{}
+        stats(): returns a dict of the counters for each collector, by name
+    '''
+
+    def __init__(self, data, timings):
+        self.data = data
+        self.timings = timings
+        self.collectors = {}
+        self.lock = Lock()
+        self.pool = Workers(0, 'sbceye_collect')
+
+    def add(self, name, func, interval, timeout):
+        '''Register a collector'''
+        self.collectors[name] = _Collector(name, func, interval, timeout)
+        # A thread per collector, since a collector never runs twice at once
+        self.pool.workers = len(self.collectors)
+
+    def start(self, timers):
+        '''Schedule each collector, to finish (within its timeout) by the
+        aligned interval at which the readings are sampled'''
+        for collector in self.collectors.values():
+            timers.every(collector.interval,
+                    lambda collector=collector: self._submit(collector),
+                    collector.name, align=True,
+                    advance=min(collector.timeout, collector.interval))
+
+    def collect(self):
+        '''Run every collector now, waiting for them to finish'''
+        futures = [self._submit(collector) for collector in self.collectors.values()]
+        timeout = max((c.timeout for c in self.collectors.values()), default=0)
+        wait([future for future in futures if future], timeout)
+
+    def _submit(self, collector):
+        '''Start a run of the collector, unless it is still running'''
+        with self.lock:
+            if collector.future and not collector.future.done():
+                collector.skipped += 1
+                self._check(collector, time.monotonic())
+                if not collector.overrun:
+                    logging.info(f'Collector {collector.name} still running, skipped')
+                return None
+            collector.started = time.monotonic()
+            collector.future = self.pool.submit(self._run, collector)
+            return collector.future
+
+    def _run(self, collector):
+        '''Run the collector and publish its readings'''
+        readings = {}
+        failed = False
+        try:
+            collector.func(readings)
+        except Exception as error:  # pylint: disable=broad-except
+            collector.errors += 1
+            failed = True
+            logging.error(f'Collector {collector.name} failed: {error}')
+        collector.duration = time.monotonic() - collector.started
+        collector.runs += 1
+        self.timings.record(collector.name, collector.duration)
+        with self.lock:
+            if failed:
+                # Partial readings are discarded, the previous ones are now stale
+                for key in collector.keys:
+                    self.data[key] = 'U'
+            else:
+                for key, value in readings.items():
+                    self.data[key] = value
+                collector.keys = set(readings)
+            if collector.overrun:
+                collector.overrun = False
+                logging.info(f'Collector {collector.name} recovered, '\
+                        f'took {collector.duration:.1f}s')
+
+    def _check(self, collector, now):
+        '''Flag the collector if it has exceeded its timeout, call with the lock held'''
+        if collector.overrun or not collector.future or collector.future.done():
+            return
+        elapsed = now - collector.started
+        if elapsed > collector.timeout:
+            collector.overrun = True
+            collector.timeouts += 1
+            logging.warning(f'Collector {collector.name} has run for {elapsed:.1f}s, '\
+                    f'over its {collector.timeout}s timeout; skipping it until it finishes')
+            for key in collector.keys:
+                self.data[key] = 'U'
+
+    def check(self):
+        '''Detect collectors that have exceeded their timeout'''
+        now = time.monotonic()
+        with self.lock:
+            for collector in self.collectors.values():
+                self._check(collector, now)
+
+    def snapshot(self):
+        '''A copy of data{}, taken between collector publications'''
+        with self.lock:
+            return dict(self.data)
+
+    def stats(self):
+        '''The counters for each collector'''
+        return {name: collector.stats() for name, collector in self.collectors.items()}
@@ -0,0 +1,132 @@
+'''On-disk cache of the most recent compressed RRD dump for the SBCEye project
+
+provides:
+    DumpCache: keeps one gzipped xml dump of the database on disk, shared
+        by all dump downloads and only regenerated when it becomes stale
+'''
+
+# pragma pylint: disable=logging-fstring-interpolation
+
+import os
+import time
+import logging
+from math import ceil
+from subprocess import CalledProcessError
+from threading import Lock, Thread
+import rrdtool
+
+# Returned by get() while a dump is being made
+BUSY = 'busy'
+# Seconds to retry after, until a dump has been timed
+RETRY = 10
+
+class DumpCache:
+    '''Keep the latest compressed dump of the database in a file
+
+    The dump is tagged with the database write generation it was made from,
+    and is reused until the database has been written since and the dump
+    is older than the staleness limit. Dumps are made in the background, one
+    at a time; requests arriving while one is made are told to retry, rather
+    than being held for the whole dump. The dump is opened with the lock
+    held, so a request always gets the file its tags describe even if a new
+    dump replaces it while it is being sent.
+
+    parameters:
+        rrd: the Robin database instance, provides dump() and generation,
+            dump() returns the stream and the generation it was made from
+        path: (str) the dump file, written via a temporary file alongside it
+        stale: (int) seconds a dump is reused for after the data changes
+
+    provides:
+        get(): returns (file, generation, created) of a current dump, opened
+            for reading, BUSY while one is being made, or None if making it
+            failed
+        retry: (int) seconds a request told BUSY should wait before retrying
+    '''
+
+    def __init__(self, rrd, path, stale):
+        self.rrd = rrd
+        self.path = str(path)
+        self.stale = stale
+        self.current = None  # (generation, created) of the dump on disk
+        self.running = False
+        self.failed = False
+        self.retry = RETRY
+        self.lock = Lock()
+        # A dump left from a previous run is of unknown generation; remove it
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _fresh(self):
+        '''True if the dump on disk can be served'''
+        if self.current is None:
+            return False
+        (generation, created) = self.current
+        return generation == self.rrd.generation or time.time() - created < self.stale
+
+    def get(self):
+        '''Return (file, generation, created) of a current dump, BUSY while
+        one is being made, or None if the last attempt to make one failed'''
+        with self.lock:
+            if self._fresh():
+                try:
+                    dumpfile = open(self.path, 'rb')  # pylint: disable=consider-using-with
+                    return (dumpfile, *self.current)
+                except OSError as open_error:
+                    logging.error(f'Dump unreadable: {open_error}')
+                    self.current = None
+            if self.running:
+                return BUSY
+            if self.failed:
+                # Report the failure once, the next request tries again
+                self.failed = False
+                return None
+            self.running = True
+        Thread(target=self._build, name='sbceye_dump', daemon=True).start()
+        return BUSY
+
+    def _build(self):
+        '''Make a new dump and move it into place'''
+        made = None
+        try:
+            made = self._generate()
+        finally:
+            with self.lock:
+                self.running = False
+                self.failed = not made
+                if made:
+                    (partial, generation, created) = made
+                    try:
+                        os.replace(partial, self.path)
+                        self.current = (generation, created)
+                        self.retry = max(1, ceil(time.time() - created))
+                    except OSError as replace_error:
+                        logging.error(f'Dump failed: {replace_error}')
+                        self.failed = True
+
+    def _generate(self):
+        '''Dump the database to a temporary file
+        returns (partial path, generation, created), or None on failure'''
+        created = time.time()
+        partial = f'{self.path}.partial'
+        stream = None
+        try:
+            # Tagged with the generation of the snapshot, taken after the cache flush
+            dumped = self.rrd.dump()
+            if not dumped:
+                return None
+            (stream, generation) = dumped
+            with open(partial, 'wb') as dumpfile:
+                for block in stream:
+                    dumpfile.write(block)
+        except (OSError, CalledProcessError, rrdtool.OperationalError) as dump_error:
+            logging.error(f'Dump failed: {dump_error}')
+            print(f'Error: Dump failed: {dump_error}')
+            if os.path.exists(partial):
+                os.remove(partial)
+            return None
+        finally:
+            if stream:
+                stream.close()
+        logging.info(f'Dump cached in {(time.time() - created):.2f}s')
+        return (partial, generation, created)
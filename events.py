@@ -0,0 +1,108 @@
+'''Server-Sent Events fan-out of live readings for the SBCEye project
+
+provides:
+    EventHub: publishes changes in the data{} dictionary to any number of
+        '/events' clients, each client waits for and shares the same event
+'''
+
+import json
+from threading import Condition
+
+# Seconds between keepalive comments on an idle stream
+KEEPALIVE = 15
+# Milliseconds a browser waits before reconnecting a dropped stream
+RETRY = 5000
+
+def _frame(event_id, values):
+    '''A complete, encoded, event-stream message for a set of values'''
+    payload = json.dumps(values, separators=(',', ':'))
+    return f'id: {event_id}\nevent: update\ndata: {payload}\n\n'.encode('utf-8')
+
+class EventHub:
+    '''Publish the readings that changed since the last update as a single
+    pre-encoded event, which every connected client then writes as-is
+
+    The readings are formatted (by the formatter) as they are shown on the
+    main page, only the ones whose displayed text changed are sent. The cost
+    of publishing does not depend on the number of clients; they are woken
+    together and each writes the same bytes to its own connection.
+
+    parameters:
+        formatter: (func) formatter(key, value) returns the displayed text
+            for a reading, or None if the reading is not displayed
+        clients: (int) maximum number of simultaneous streams
+
+    provides:
+        publish(data): send any changed readings to the clients
+        subscribe(): returns a generator of event-stream blocks for a new
+            client, or None if there are already too many
+        stats(): returns a dict of client and event counters
+    '''
+
+    def __init__(self, formatter, clients):
+        self.formatter = formatter
+        self.max_clients = clients
+        self.clients = 0
+        self.values = {}
+        self.event_id = 0
+        self.event = b''
+        self.condition = Condition()
+
+    def publish(self, data):
+        '''Compare the data with the last published values and, if anything
+        has changed, make a new event and wake the clients'''
+        with self.condition:
+            changed = {}
+            for key, value in list(data.items()):
+                text = self.formatter(key, value)
+                if text is not None and self.values.get(key) != text:
+                    changed[key] = text
+            if not changed:
+                return
+            self.values.update(changed)
+            self.event_id += 1
+            self.event = _frame(self.event_id, changed)
+            self.condition.notify_all()
+
+    def subscribe(self):
+        '''Admit a new client, returns its stream or None if we are full'''
+        with self.condition:
+            if self.clients >= self.max_clients:
+                return None
+            self.clients += 1
+        stream = self._stream()
+        next(stream)  # prime, so that closing the stream always releases the slot
+        return stream
+
+    def _stream(self):
+        '''Generator, the event stream for one client; starts with all the
+        current values, then yields each new event, or a keepalive comment'''
+        try:
+            yield b''
+            with self.condition:
+                last = self.event_id
+                block = f'retry: {RETRY}\n'.encode('ascii') + _frame(last, self.values)
+            while True:
+                yield block
+                with self.condition:
+                    self.condition.wait_for(lambda: self.event_id != last, KEEPALIVE)
+                    if self.event_id == last:
+                        block = b': keepalive\n\n'
+                    elif self.event_id == last + 1:
+                        block = self.event
+                    else:
+                        # This client fell behind, send everything instead
+                        block = _frame(self.event_id, self.values)
+                    last = self.event_id
+        finally:
+            with self.condition:
+                self.clients -= 1
+
+    def stats(self):
+        '''Return the client and event counters'''
+        with self.condition:
+            return {
+                    'clients': self.clients,
+                    'max_clients': self.max_clients,
+                    'events': self.event_id,
+                    }
@@ -0,0 +1,67 @@
+'''Bounded in-memory LRU cache for rendered graph images and series
+
+provides:
+    GraphCache: A thread-safe, byte-budgeted least-recently-used cache
+'''
+
+from collections import OrderedDict
+from threading import Lock
+
+class GraphCache:
+    '''Cache rendered png images (or other response bodies), evicting the least
+    recently used entries once their total size exceeds the byte budget
+
+    parameters:
+        budget: (int) maximum total size of cached images in bytes, 0 disables
+
+    provides:
+        get(key): returns the cached image for key, or None
+        put(key, image): stores an image, evicting old entries as needed
+        stats(): returns a dict of counters for tuning the budget
+    '''
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def get(self, key):
+        '''Return the cached image for key (marking it recently used) or None'''
+        with self.lock:
+            image = self.entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        '''Store an image, images larger than the entire budget are not cached'''
+        if len(image) == 0 or len(image) > self.budget:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = bytes(image)
+            self.size += len(image)
+            while self.size > self.budget:
+                _, old = self.entries.popitem(last=False)
+                self.size -= len(old)
+                self.evictions += 1
+
+    def stats(self):
+        '''Return the cache counters'''
+        with self.lock:
+            return {
+                    'entries': len(self.entries),
+                    'bytes': self.size,
+                    'budget': self.budget,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    }
@@ -6,51 +6,129 @@
 import sys
 import os.path
 import time
-from subprocess import check_output
+from html import escape
+from itertools import chain
+from functools import partial
 import re
+import json
+import zlib
+from hashlib import blake2b
 
 # HTTP server
 import http.server
 from urllib.parse import urlparse, parse_qs
-from threading import Thread
+from threading import Thread, BoundedSemaphore
 
 # Logging
 import logging
+from logreader import tail, LogIndex, LEVELS, parse_when
+from aioserver import AsyncHTTPServer
+from dumpcache import BUSY
+from timing import RequestStats, TimedWriter, track, untrack, BUCKETS, PHASES
 
-def serve_http(settings, rrd, data, helpers):
+# Optional brotli compression
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content encodings we can offer, in order of preference
+ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+# Log requests for more lines than this are streamed
+LOG_STREAM_LINES = 2500
+# Bodies larger than this are compressed and sent in chunks
+STREAM_SIZE = 1048576
+STREAM_CHUNK = 65536
+
+# Routes reported individually on the '/stats' page, anything else is '(other)'
+ROUTES = ('/', '/graph', '/overview', '/graphs', '/api/series', '/api/recent',
+        '/api/current', '/healthz', '/events', '/metrics', '/stats', '/favicon.ico', '/dump_gz', '/dump', '/log')
+
+# Routes that deliberately hold the request open, not reported as slow
+HELD_ROUTES = ('/events', '/api/current')
+
+# Readings shown on the main page: key: (name, format, units)
+ENV_READINGS = {
+        'env-temp': ('Temperature','.1f','&deg;'),
+        'env-humi': ('Humidity','.1f','<span style="font-size: 75%;">%</span>'),
+        'env-pres': ('Presssure','.0f','<span style="font-size: 75%;"> mb</span>'),
+        }
+SYS_READINGS = {
+        'sys-temp': ('CPU Temperature','.1f','&deg;'),
+        'sys-load': ('CPU Load','1.2f',''),
+        'sys-freq': ('CPU Frequency','.0f','<span style="font-size: 75%;"> MHz</span>'),
+        'sys-mem': ('Memory used','.1f','<span style="font-size: 75%;">%</span>'),
+        'sys-disk': ('Disk used','.1f','<span style="font-size: 75%;">%</span>'),
+        'sys-proc': ('Processes','.0f',''),
+        'sys-net-io': ('Network IO','.1f','<span style="font-size: 75%;"> k/s</span>'),
+        'sys-disk-io': ('Disk IO','.1f','<span style="font-size: 75%;"> k/s</span>'),
+        'sys-cpu-int': ('Soft Interrupts','.0f','<span style="font-size: 75%;"> /s</span>'),
+        }
+NET_UNITS = '<span style="font-size: 75%;"> ms</span>'
+# Units of the readings in '/api/current'
+UNITS = {
+        'env-temp': '°C', 'env-humi': '%', 'env-pres': 'mb',
+        'sys-temp': '°C', 'sys-load': '', 'sys-freq': 'MHz', 'sys-mem': '%',
+        'sys-disk': '%', 'sys-proc': '', 'sys-net-io': 'kB/s', 'sys-disk-io': 'kB/s',
+        'sys-cpu-int': '/s', 'net-': 'ms', 'pin-': '',
+        }
+# Longest '/api/current?wait=' allowed, seconds
+MAX_WAIT = 300
+
+def serve_http(settings, rrd, data, helpers, recent=None, events=None, metrics=None):
     '''Spawns a http.server.HTTPServer in a separate thread on the given port'''
     handler = _BaseRequestHandler
-    httpd = http.server.ThreadingHTTPServer((settings.web_host, settings.web_port), handler, False)
-    #httpd = http.server.HTTPServer((settings.web_host, settings.web_port), handler, False)
-    # Block only for 0.5 seconds max
-    httpd.timeout = 0.5
-    # HTTPServer sets this as well (left here to make obvious).
-    httpd.allow_reuse_address = True
     # I'm just passing objects blindly into the http class itself, quick and dirty but it works
     # there is probably a better way to do this, eg using a meta-class and inheritance
     http.settings = settings
     http.rrd = rrd
     http.data = data
+    http.recent = recent
+    http.events = events
+    http.metrics = metrics
+    http.pages = {}
+    http.current = None
+    http.request_stats = RequestStats()
+    # Long-polls hold a thread each, so only (web_long_polls) may wait at once
+    http.long_polls = BoundedSemaphore(settings.web_long_polls) \
+            if settings.web_long_polls > 0 else None
+    http.long_polls_rejected = 0
+    http.log_index = LogIndex(settings.log_file, settings.short_format)
     http.button_control = helpers[0]
     http.icon_file = 'favicon.ico'
     if not os.path.exists(http.icon_file):
         http.icon_file = f'{sys.path[0]}/{http.icon_file}'
+    http.db_graphable = rrd.graphable
+    if not rrd.graphable:
+        logging.warning('No graph renderer available, graphing functions are unavailable')
     if rrd.rrdtool:
-        http.db_graphable = True
         if settings.web_allow_dump:
             logging.info("RRD database is dumpable via web")
             http.db_dumpable = True
         else:
             http.db_dumpable = False
     else:
-        logging.warning('Commandline rrdtool not found, '\
-                'graphing and dumping functions are unavailable')
+        logging.warning('Commandline rrdtool not found, dumping functions are unavailable')
         http.db_dumpable = False
-        http.db_graphable = False
 
     # Start the server
     logging.info(f'HTTP server will bind to port {str(settings.web_port)} '\
             f'on host {settings.web_host}')
+    if settings.web_server == 'async':
+        # Connections are held by an event loop, requests run on a worker pool
+        httpd = AsyncHTTPServer((settings.web_host, settings.web_port), handler,
+                (settings.web_connections, settings.web_timeout, settings.web_keepalive))
+        httpd.start()
+        address = f"http://{httpd.server_name}:{httpd.server_port}"
+        print(f"Webserver (async, max {settings.web_connections} connections) "\
+                f"starting on : {address}")
+        return
+    httpd = http.server.ThreadingHTTPServer((settings.web_host, settings.web_port), handler, False)
+    #httpd = http.server.HTTPServer((settings.web_host, settings.web_port), handler, False)
+    # Block only for 0.5 seconds max
+    httpd.timeout = 0.5
+    # HTTPServer sets this as well (left here to make obvious).
+    httpd.allow_reuse_address = True
     httpd.server_bind()
     address = f"http://{httpd.server_name}:{httpd.server_port}"
     print(f"Webserver starting on : {address}")
@@ -67,35 +145,257 @@ def serve_http(settings, rrd, data, helpers):
     thread.start()
 
 
+def format_reading(settings, key, value):
+    '''Format a reading as it is shown on the main page
+    returns the text, or None for readings that are not shown'''
+    if key == 'update-time':
+        return time.strftime(settings.long_format, time.localtime(value))
+    if key[0:4] == 'pin-':
+        return settings.pin_state_names[value]
+    if key in ENV_READINGS:
+        fmt = ENV_READINGS[key][1]
+    elif key in SYS_READINGS:
+        fmt = SYS_READINGS[key][1]
+    elif key[0:4] == 'net-':
+        fmt = '.1f'
+    else:
+        return None
+    try:
+        return f'{value:{fmt}}'
+    except (TypeError, ValueError):
+        # 'U' (unknown), eg a failed ping
+        return 'Fail'
+
+def _unit_style(value):
+    '''Units are hidden for readings that failed'''
+    return ' visibility: hidden;' if value == 'Fail' else ''
+
+def _compressor(encoding):
+    '''Returns (compress, flush) functions for an incremental compressor'''
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+def _compress(body, encoding):
+    '''Compress a complete body, returns body unchanged if encoding is None'''
+    if not encoding:
+        return body
+    (compress, flush) = _compressor(encoding)
+    return compress(body) + flush()
+
+def _compress_stream(stream, encoding):
+    '''Generator, compresses blocks from an iterator as they arrive'''
+    (compress, flush) = _compressor(encoding)
+    for block in stream:
+        if isinstance(block, str):
+            block = block.encode('utf-8')
+        yield compress(block)
+    yield flush()
+
+
 class _BaseRequestHandler(http.server.BaseHTTPRequestHandler):
     '''Handles each individual request in a new thread'''
 
-    def _set_headers(self):
+    def _begin(self, stream=False):
+        # Start a 200 response; streams use chunked transfer encoding for
+        #  HTTP/1.1 clients, otherwise the end is marked by closing the connection
+        self.chunked = stream and self.request_version != 'HTTP/1.0'
+        if self.chunked:
+            self.protocol_version = 'HTTP/1.1'
         self.send_response(200)
+
+    def _set_length_headers(self, size, encoding=None, stream=False):
+        # Content encoding, and length or streaming headers
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+            self.send_header("Vary", "Accept-Encoding")
+        if stream:
+            if self.chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("Connection", "close")
+        elif size is not None:
+            self.send_header("Content-Length", str(size))
+
+    def _set_headers(self, size=None, encoding=None, stream=False):
+        self._begin(stream)
         self.send_header("Content-type", "text/html")
         self.send_header("Cache-Control", "no-cache, no-store, must-revalidate")
         self.send_header("Pragma", "no-cache")
         self.send_header("Expires", "0")
+        self._set_length_headers(size, encoding, stream)
         self.end_headers()
 
-    def _set_png_headers(self):
+    def _set_png_headers(self, size):
         self.send_response(200)
         self.send_header("Content-type", "image/png")
         self.send_header("Cache-Control", "max-age=60")
+        self.send_header("Content-Length", str(size))
         self.end_headers()
 
-    def _set_download_headers(self, size, name):
+    def _set_json_headers(self, size=None, encoding=None, stream=False, max_age=10):
+        self._begin(stream)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Cache-Control", f"max-age={max_age}" if max_age else "no-cache")
+        self._set_length_headers(size, encoding, stream)
+        self.end_headers()
+
+    def _set_metrics_headers(self, size, encoding=None):
         self.send_response(200)
+        self.send_header("Content-type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self._set_length_headers(size, encoding)
+        self.end_headers()
+
+    def _set_event_headers(self):
+        self._begin(stream=True)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self._set_length_headers(None, stream=True)
+        self.end_headers()
+
+    def _set_download_headers(self, size, name, validators, content_range=None):
+        self.send_response(206 if content_range else 200)
         self.send_header("Content-Type", 'application/octet-stream')
         self.send_header("Content-Disposition", f'attachment; filename="{name}"')
         self.send_header("Content-Length", str(size))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", validators[0])
+        self.send_header("Last-Modified", validators[1])
+        if content_range:
+            self.send_header("Content-Range", content_range)
         self.end_headers()
 
-    def _set_icon_headers(self):
+    def _byte_range(self, size, validators):
+        # Parse a single range 'Range: bytes=..' header, honouring If-Range
+        #  returns (first, last) byte positions, None to send the whole file,
+        #  or False if the range cannot be satisfied
+        requested = self.headers.get('Range', '').strip()
+        if not requested.startswith('bytes=') or ',' in requested:
+            return None
+        condition = self.headers.get('If-Range')
+        if condition and condition.strip() not in validators:
+            return None
+        (first, _, last) = requested[6:].strip().partition('-')
+        try:
+            if not first:
+                # suffix range, the last (last) bytes
+                if int(last) <= 0:
+                    return False
+                return (max(0, size - int(last)), size - 1)
+            first = int(first)
+            last = int(last) if last else size - 1
+        except ValueError:
+            return None
+        if first >= size or last < first:
+            return False
+        return (first, min(last, size - 1))
+
+    def _send_file(self, file, name):
+        # Send a file as a download, or the part of it asked for in a range
+        #  request, with sendfile() straight from the file to the socket
+        stat = os.fstat(file.fileno())
+        size = stat.st_size
+        validators = (f'"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{size:x}"',
+                self.date_time_string(int(stat.st_mtime)))
+        byte_range = self._byte_range(size, validators)
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header("Content-Range", f'bytes */{size}')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if byte_range:
+            (offset, last) = byte_range
+            count = last - offset + 1
+            self._set_download_headers(count, name, validators,
+                    f'bytes {offset}-{last}/{size}')
+        else:
+            (offset, count) = (0, size)
+            self._set_download_headers(count, name, validators)
+        if hasattr(self, 'connection'):
+            self.wfile.sendfile(self.connection.fileno(), file.fileno(), offset, count)
+            return
+        # No socket (async server), copy in chunks
+        file.seek(offset)
+        while count > 0:
+            block = file.read(min(STREAM_CHUNK, count))
+            if not block:
+                break
+            self.wfile.write(block)
+            count -= len(block)
+
+    def _write_stream(self, stream, encoding=None):
+        # Write blocks from an iterator as they arrive, compressing if needed
+        if encoding:
+            stream = _compress_stream(stream, encoding)
+        for block in stream:
+            if not block:
+                continue
+            if isinstance(block, str):
+                block = block.encode('utf-8')
+            if self.chunked:
+                self.wfile.write(f'{len(block):X}\r\n'.encode('ascii') + block + b'\r\n')
+            else:
+                self.wfile.write(block)
+        if self.chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
+    def _choose_encoding(self, size):
+        # Pick a content encoding the client accepts, None if not worthwhile
+        if size < http.settings.web_compress_min:
+            return None
+        accepted = {}
+        for item in self.headers.get('Accept-Encoding', '').split(','):
+            (name, *params) = [part.strip() for part in item.split(';')]
+            quality = 1.0
+            for param in params:
+                if param.startswith('q='):
+                    try:
+                        quality = float(param[2:])
+                    except ValueError:
+                        quality = 0
+            accepted[name.lower()] = quality
+        for encoding in ENCODINGS:
+            if accepted.get(encoding, 0) > 0:
+                return encoding
+        return None
+
+    def _send_compressed(self, body, set_headers):
+        # Send a complete body, compressed if worthwhile and accepted
+        #  set_headers(size, encoding, stream) sends the response headers
+        encoding = self._choose_encoding(len(body))
+        if encoding and len(body) > STREAM_SIZE:
+            # Very large bodies are compressed and sent a chunk at a time
+            set_headers(encoding=encoding, stream=True)
+            view = memoryview(body)
+            self._write_stream((view[i:i + STREAM_CHUNK]
+                    for i in range(0, len(body), STREAM_CHUNK)), encoding)
+            return
+        if encoding:
+            body = _compress(body, encoding)
+        set_headers(size=len(body), encoding=encoding)
+        self.wfile.write(body)
+
+    def _set_icon_headers(self, size):
         self.send_response(200)
         self.send_header("Content-type", "image/x-icon")
+        self.send_header("Content-Length", str(size))
         self.end_headers()
 
+    def _send_busy(self, retry=None, message=b'Server busy, please retry shortly\n'):
+        # Fast refusal when the render pool is saturated, or when a download
+        #  is still being prepared (retry), which browsers are told to refresh
+        self.send_response(503)
+        self.send_header("Content-type", "text/plain")
+        self.send_header("Retry-After", str(retry or http.settings.graph_retry))
+        if retry:
+            self.send_header("Refresh", str(retry))
+        self.send_header("Content-Length", str(len(message)))
+        self.end_headers()
+        self.wfile.write(message)
+
     def _give_head(self, title_extra=""):
         title = http.settings.name
         if len(title_extra) > 0:
@@ -118,10 +418,35 @@ class _BaseRequestHandler(http.server.BaseHTTPRequestHandler):
                 </head>
                 <body>'''
 
-    def _give_foot(self, refresh=0, scroll=False):
+    def _give_foot(self, refresh=0, scroll=False, events=False):
         ret = '''</body>\n
                 <script>\n'''
-        if refresh > 0:
+        if events:
+            # Patch the readings in place from the event stream, falling
+            #  back to reloading the page if the stream is unavailable
+            ret += f'''function reload() {{
+                        setTimeout(function(){{location.replace(document.URL);}}, {refresh*1000});
+                    }}
+                    if (window.EventSource) {{
+                        var source = new EventSource("./events");
+                        source.addEventListener("update", function(event) {{
+                            var changes = JSON.parse(event.data);
+                            for (var key in changes) {{
+                                var cell = document.getElementById("v-" + key);
+                                if (!cell) continue;
+                                cell.textContent = changes[key];
+                                var unit = cell.nextElementSibling;
+                                if (unit) unit.style.visibility =
+                                        (changes[key] == "Fail") ? "hidden" : "";
+                            }}
+                        }});
+                        source.onerror = function() {{
+                            if (source.readyState == EventSource.CLOSED) reload();
+                        }};
+                    }} else {{
+                        reload();
+                    }}\n'''
+        elif refresh > 0:
             ret += 'setTimeout(function(){location.replace(document.URL);}, '\
                     f'{str(refresh*1000)});\n'
         if scroll:
@@ -135,9 +460,8 @@ class _BaseRequestHandler(http.server.BaseHTTPRequestHandler):
         return ret
 
     def _give_timestamp(self):
-        timestamp = time.strftime(http.settings.long_format,
-                time.localtime(http.data["update-time"]))
-        return  f'''<div title="Time of latest data readings"
+        timestamp = format_reading(http.settings, 'update-time', http.data["update-time"])
+        return  f'''<div id="v-update-time" title="Time of latest data readings"
                 style="color:#555555;
                 font-size: 94%; padding-top: 0.5em;">{timestamp}</div>
                 <div style="color:#555555;
@@ -149,42 +473,30 @@ class _BaseRequestHandler(http.server.BaseHTTPRequestHandler):
 
     def _give_env(self):
         # Environmental sensor
-        sensorlist = {
-                'env-temp': ('Temperature','.1f','&deg;'),
-                'env-humi': ('Humidity','.1f','<span style="font-size: 75%;">%</span>'),
-                'env-pres': ('Presssure','.0f','<span style="font-size: 75%;"> mb</span>'),
-                }
         ret = ''
-        if len(http.data.keys() & sensorlist.keys()) > 0:
+        if len(http.data.keys() & ENV_READINGS.keys()) > 0:
             ret += f'<tr><th>{http.settings.web_sensor_name}</th></tr>\n'
-            for sense,(name,fmt,suffix) in sensorlist.items():
-                if sense in http.data.keys():
-                    ret += f'<tr><td>{name}: </td><td style="text-align: right;">'\
-                            f'{http.data[sense]:{fmt}}</td>'\
-                            f'<td style="padding-left: 0;">{suffix}</td></tr>\n'
+            ret += self._give_readings(ENV_READINGS)
         return ret
 
     def _give_sys(self):
         # Internal Sensors
-        sensorlist = {
-                'sys-temp': ('CPU Temperature','.1f','&deg;'),
-                'sys-load': ('CPU Load','1.2f',''),
-                'sys-freq': ('CPU Frequency','.0f','<span style="font-size: 75%;"> MHz</span>'),
-                'sys-mem': ('Memory used','.1f','<span style="font-size: 75%;">%</span>'),
-                'sys-disk': ('Disk used','.1f','<span style="font-size: 75%;">%</span>'),
-                'sys-proc': ('Processes','.0f',''),
-                'sys-net-io': ('Network IO','.1f','<span style="font-size: 75%;"> k/s</span>'),
-                'sys-disk-io': ('Disk IO','.1f','<span style="font-size: 75%;"> k/s</span>'),
-                'sys-cpu-int': ('Soft Interrupts','.0f','<span style="font-size: 75%;"> /s</span>'),
-                }
         ret = ''
-        if len(http.data.keys() & sensorlist.keys()) > 0:
+        if len(http.data.keys() & SYS_READINGS.keys()) > 0:
             ret = '<tr><th>Server</th></tr>\n'
-            for sense,(name,fmt,suffix) in sensorlist.items():
-                if sense in http.data.keys():
-                    ret += f'<tr><td>{name}: </td><td style="text-align: right;">'\
-                            f'{http.data[sense]:{fmt}}</td>'\
-                            f'<td style="padding-left: 0;">{suffix}</td></tr>\n'
+            ret += self._give_readings(SYS_READINGS)
+        return ret
+
+    def _give_readings(self, readings):
+        # Table rows for the readings present, value cells carry an id so that
+        #  the page can be updated in place from the '/events' stream
+        ret = ''
+        for sense,(name,_,suffix) in readings.items():
+            if sense in http.data.keys():
+                value = format_reading(http.settings, sense, http.data[sense])
+                ret += f'<tr><td>{name}: </td>'\
+                        f'<td id="v-{sense}" style="text-align: right;">{value}</td>'\
+                        f'<td style="padding-left: 0;{_unit_style(value)}">{suffix}</td></tr>\n'
         return ret
 
     def _give_net(self):
@@ -193,18 +505,10 @@ class _BaseRequestHandler(http.server.BaseHTTPRequestHandler):
         netlist = {}
         for key in http.data.keys():
             if key[0:4] == 'net-':
-                netlist[key] = key[4:]
+                netlist[key] = (key[4:], '.1f', NET_UNITS)
         if len(http.data.keys() & netlist.keys()) > 0:
             ret += '<tr><th>Ping</th></tr>\n'
-            for item,name in netlist.items():
-                ret += f'<tr><td>{name}:</td><td style="text-align: right;">'
-                if http.data[item] == 'U':
-                    ret += 'Fail</td></tr>\n'
-                else:
-                    ret += f'{http.data[item]:.1f}</td>'\
-                            '<td style="padding-left: 0;">'\
-                            '<span style="font-size: 75%;"> ms</span>'\
-                            '</td></tr>\n'
+            ret += self._give_readings(netlist)
         return ret
 
 
@@ -218,26 +522,34 @@ class _BaseRequestHandler(http.server.BaseHTTPRequestHandler):
         if len(http.data.keys() & pinlist.keys()) > 0:
             ret += '<tr><th>GPIO</th></tr>\n'
             for item,name in pinlist.items():
-                ret += f'<tr><td>{name}:</td><td style="text-align: right;">'\
+                ret += f'<tr><td>{name}:</td><td id="v-{item}" style="text-align: right;">'\
                        f'{http.settings.pin_state_names[http.data[item]]}</td></tr>\n'
         return ret
 
-    def _give_graphlinks(self, skip=""):
+    def _give_graphlinks(self, skip="", view=""):
         # A list of available graph pages
         ret = ''
         skip = skip.lstrip('end-')
+        mode = f'&view={view}' if view else ''
         if (len(http.settings.graph_durations) > 0) and http.db_graphable:
             if len(skip) == 0:
                 ret += '<tr><th>Graphs</th></tr>\n'
             ret += '<tr><td colspan="2" style="text-align: center;">\n'
             for duration in http.settings.graph_durations:
                 if duration != skip:
-                    ret += f'&nbsp;<a href="./graphs?start=end-{duration}" '\
+                    ret += f'&nbsp;<a href="./graphs?start=end-{duration}{mode}" '\
                            f'title="Graphs covering the last {duration} in time">'\
                            f'{duration}</a>&nbsp;\n'
                 else:
                     ret += f'&nbsp;<span style="color: #BBBBBB;">{duration}</span>&nbsp;\n'
             if len(skip) > 0:
+                if view == 'overview':
+                    ret += f'&nbsp;:&nbsp;&nbsp;<a href="./graphs?start=end-{skip}" '\
+                            'title="Show each graph individually">All</a>\n'
+                else:
+                    ret += f'&nbsp;:&nbsp;&nbsp;<a href="./graphs?start=end-{skip}'\
+                            '&view=overview" title="Show all sources on one graph">'\
+                            'Overview</a>\n'
                 ret += '&nbsp;:&nbsp;&nbsp;<a href="./" title="Main page">Home</a>\n'
             ret += '</td></tr>\n'
         return ret
@@ -255,51 +567,85 @@ class _BaseRequestHandler(http.server.BaseHTTPRequestHandler):
         ret += '</td></tr>\n'
         return ret
 
-    def _give_log(self, lines=25):
-        # Combine and give last (lines) lines of log
+    def _log_lines(self, lines=25):
+        # Number of log lines requested
         parsed_lines = parse_qs(urlparse(self.path).query).get('lines', None)
         if isinstance(parsed_lines, list):
             lines = parsed_lines[0]
-        # Do not pass anything other than integers to the shell commsnd..
         if not isinstance(lines, int):
             try:
                 lines = int(lines)
             except ValueError:
                 lines = int(100)
-        lines = max(1, min(lines, 250000))
-        # Use a shell one-liner used to extract the last {lines} of data from the logs
-        # There is doubtless a more 'python' way to do this, but it is fast, cheap and works..
-        log_command = \
-            f"for a in `ls -tr {http.settings.log_file}*`;do cat $a ; done | tail -{lines}"
-        log = check_output(log_command, shell=True).decode('utf-8')
-        ret = f'''
+        return max(1, min(lines, 250000))
+
+    def _give_log_head(self):
+        return '''
                 <div style="overflow-x: auto; width: 100%;">\n
                 <span style="font-size: 110%; font-weight: bold;">Recent log activity:</span>
-                <hr><pre>\n{log}</pre><hr>
-                <span style="font-size: 80%;">Latest {lines} lines shown</span>\n
+                <hr><pre>\n'''
+
+    def _give_log_foot(self, lines, query=None):
+        if query is None:
+            shown = f'Latest {lines} lines shown'
+        else:
+            shown = f'{lines} matching lines shown'
+        query = query or {}
+        levels = ''.join(f'<option{" selected" if query.get("level") == level else ""}>'\
+                f'{level}</option>' for level in ['', *LEVELS])
+        return f'''</pre><hr>
+                <span style="font-size: 80%;">{shown}</span>\n
                 </div>\n
+                <form action="./log" style="font-size: 80%; padding-bottom: 0.5em;">
+                Since: <input name="since" size="10" value="{escape(query.get("since", ""))}"
+                title="Epoch time, ISO date/time or age (eg 30m, 6h, 2d)">
+                Until: <input name="until" size="10" value="{escape(query.get("until", ""))}"
+                title="Epoch time, ISO date/time or age (eg 30m, 6h, 2d)">
+                Level: <select name="level">{levels}</select>
+                Text: <input name="grep" size="12" value="{escape(query.get("grep", ""))}">
+                <input type="submit" value="Search">
+                </form>\n
                 <div><a href="./log?lines=25" title="show 25 lines">25</a>&nbsp;:
                 &nbsp;<a href="./log?lines=250" title="show 250 lines">250</a>&nbsp;:
                 &nbsp;<a href="./log?lines=2500" title="show 2500 lines">2500</a>&nbsp;:
                 &nbsp;<a href="./" title="Main page">Home</a></div>\n'''
-        return ret
 
-    def _give_graphs(self, start, end, stamp):
+    def _give_graphs(self, start, end, stamp, view=""):
+        if view == 'overview':
+            return self._give_overview(start, end, stamp)
         ret = f'''<table>\n
                 <tr><th>Graphs: {stamp}</th></tr>\n'''
-        for graph,(title,*_) in http.rrd.graph_map.items():
-            if graph in http.rrd.sources:
-                ret += f'''<tr><td>\n
-                        <a href="graph?graph={graph}&start={start}&end={end}">
-                        <img title="{title}"
-                        src="graph?graph={graph}&start={start}&end={end}"></a>\n
-                        </td></tr>\n'''
+        for graph in http.rrd.graph_sources():
+            title = http.rrd.graph_map[graph][0]
+            ret += f'''<tr><td>\n
+                    <a href="graph?graph={graph}&start={start}&end={end}">
+                    <img title="{title}"
+                    src="graph?graph={graph}&start={start}&end={end}"></a>\n
+                    </td></tr>\n'''
         ret += self._give_graphlinks(skip=start)
         ret += '</table>\n'
         return ret
 
+    def _give_overview(self, start, end, stamp):
+        # A single image of all sources, with links to the individual graphs
+        ret = f'''<table>\n
+                <tr><th>Overview: {stamp}</th></tr>\n
+                <tr><td>\n
+                <a href="graphs?start={start}&end={end}" title="Show each graph individually">
+                <img title="Overview of all sources"
+                src="overview?start={start}&end={end}"></a>\n
+                </td></tr>\n
+                <tr><td style="text-align: center;">\n'''
+        for graph in http.rrd.overview_sources():
+            ret += f'&nbsp;<a href="graph?graph={graph}&start={start}&end={end}" '\
+                    f'title="{http.rrd.graph_map[graph][0]}">{graph}</a>&nbsp;\n'
+        ret += '</td></tr>\n'
+        ret += self._give_graphlinks(skip=start, view='overview')
+        ret += '</table>\n'
+        return ret
+
     def _give_dump_portal(self):
-        return '''
+        return f'''
                 <h2>RRD database dump in gzipped XML format</h2>
                 <div style="text-align: center; width: 80%">What is this?
                 See: <a href="https://oss.oetiker.ch/rrdtool/doc/rrddump.en.html"
@@ -312,18 +658,164 @@ class _BaseRequestHandler(http.server.BaseHTTPRequestHandler):
                 <br>
                 It can take several minutes to complete; depending on the
                 host machine and db size+complexity. <em>Use with care!</em>
+                <br>
+                The dump is prepared in the background, while it is made the download
+                link returns a 'busy' page that retries until the dump is ready.
+                <br>
+                Once made the dump is kept and re-used until the data has changed and
+                it is more than {http.settings.rrd_dump_stale // 60} minutes old,
+                interrupted downloads can be resumed.
                 <hr>
                 If you are sure you wish to proceed:<br>
                 <a href="./dump_gz" title = "Direct download link">Download</a>
                 </div>
                 '''
 
+    def _give_current(self):
+        # The current readings as json, built once per data generation
+        key = (http.data.generation, http.data.cycle)
+        cached = http.current
+        if cached and cached[0] == key:
+            return cached[1]
+        readings = {}
+        for item, value in list(http.data.items()):
+            if item == 'update-time':
+                continue
+            reading = {'value': None if value == 'U' else value,
+                    'units': UNITS.get(item, UNITS.get(item[0:4], ''))}
+            if item[0:4] == 'pin-':
+                reading['state'] = http.settings.pin_state_names[value]
+            readings[item] = reading
+        body = json.dumps({
+                'update-time': http.data['update-time'],
+                'cycle': key[1],
+                'readings': readings,
+                }, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        http.current = (key, body)
+        return body
+
+    def _give_stats(self):
+        # Request counts, latency and where the time went, per route
+        stats = http.request_stats.stats()
+        ret = '<table>\n<tr><th>Route</th><th>Requests</th><th>Mean ms</th>'\
+                '<th>Max ms</th><th>Sent Kb</th>'
+        ret += ''.join(f'<th>{phase} ms</th>' for phase in PHASES) + '</tr>\n'
+        for route, entry in sorted(stats['routes'].items()):
+            count = entry['count']
+            ret += f'<tr><td>{escape(route)}</td><td>{count}</td>'\
+                    f'<td>{entry["total"] * 1000 / count:.1f}</td>'\
+                    f'<td>{entry["max"] * 1000:.1f}</td>'\
+                    f'<td>{entry["bytes"] / 1024:.1f}</td>'
+            ret += ''.join(f'<td>{entry["phases"][phase] * 1000 / count:.1f}</td>'
+                    for phase in PHASES) + '</tr>\n'
+        ret += '</table>\n<h3>Latency</h3>\n<table>\n<tr><th>Route</th>'
+        ret += ''.join(f'<th>&le;{bound * 1000:g}ms</th>' for bound in BUCKETS)
+        ret += f'<th>&gt;{BUCKETS[-1]:g}s</th></tr>\n'
+        for route, entry in sorted(stats['routes'].items()):
+            ret += f'<tr><td>{escape(route)}</td>'
+            ret += ''.join(f'<td>{count}</td>' for count in entry['buckets']) + '</tr>\n'
+        ret += '</table>\n'
+        ret += f'<div style="padding-top: 1em;">Requests in progress: {stats["in_flight"]}'
+        pool = http.rrd.render_pool.stats()
+        ret += f'<br>Render pool: {pool["active"]}/{pool["workers"]} active, '\
+                f'{pool["waiting"]}/{pool["queue"]} queued, {pool["rejected"]} rejected'
+        if http.long_polls:
+            ret += f'<br>Long polls: {http.long_polls_rejected} rejected'
+        if http.rrd.graph_cache:
+            cache = http.rrd.graph_cache.stats()
+            ret += f'<br>Graph cache: {cache["entries"]} graphs, '\
+                    f'{cache["bytes"] / 1024:.0f}/{cache["budget"] / 1024:.0f} Kb, '\
+                    f'{cache["hits"]} hits, {cache["misses"]} misses'
+        ret += '</div>\n'
+        return ret
+
+    def _give_main(self, cam, exclude):
+        # The main page
+        response = self._give_head()
+        if not "deco" in exclude:
+            response += f'<h2>{http.settings.name}</h2>\n'
+        if cam:
+            response += f'<img src="{http.settings.cam_url}" alt="Webcam" '\
+                    f'style="display: block; width: {http.settings.cam_width}%">\n'
+        response += '<table>\n'
+        if not "env" in exclude:
+            response += self._give_env()
+        if not "sys" in exclude:
+            response += self._give_sys()
+        if not "net" in exclude:
+            response += self._give_net()
+        if not "gpio" in exclude:
+            response += self._give_pins()
+        if not "links" in exclude:
+            response += self._give_links()
+        response += '</table>\n'
+        if not "deco" in exclude:
+            response += self._give_timestamp()
+        response += self._give_foot(refresh=60, events=bool(http.events))
+        return response
+
+    def _dedent(self, html):
+        # Strip leading whitespace and encode
+        return bytes(re.sub(r'^\s*','', html, flags=re.MULTILINE), 'utf-8')
+
     def _write_dedented(self, html):
-        # Strip leading whitespace and write
-        response = re.sub(r'^\s*','', html, flags=re.MULTILINE)
-        self.wfile.write(bytes(response, 'utf-8'))
+        # Strip leading whitespace and send with headers
+        self._send_compressed(self._dedent(html), self._set_headers)
+
+    def _write_cached(self, key, build):
+        # Serve a page from the page cache, build() is only called to
+        #  (re)generate the page when the data has changed since it was cached
+        #  compressed forms of the page are cached alongside it as needed
+        generation = http.data.generation
+        cached = http.pages.get(key)
+        if not cached or cached[0] != generation:
+            body = self._dedent(build())
+            cached = (generation, blake2b(body, digest_size=12).hexdigest(), {None: body})
+            http.pages[key] = cached
+        (_, digest, variants) = cached
+        encoding = self._choose_encoding(len(variants[None]))
+        if encoding not in variants:
+            variants[encoding] = _compress(variants[None], encoding)
+        body = variants[encoding]
+        etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+        matches = [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]
+        if etag in matches or '*' in matches:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-type", "text/html")
+        self._set_length_headers(len(body), encoding)
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
 
     def do_GET(self):
+        '''Process requests, recording their timing for the '/stats' page'''
+        path = urlparse(self.path).path
+        route = path if path in ROUTES or path == f'/{http.settings.button_url}' else '(other)'
+        (phases, token) = track()
+        writer = TimedWriter(self.wfile)
+        self.wfile = writer
+        http.request_stats.begin()
+        start = time.monotonic()
+        try:
+            self._get()
+        finally:
+            elapsed = time.monotonic() - start
+            self.wfile = writer.wfile
+            untrack(token)
+            http.request_stats.end(route, elapsed, writer.sent, phases)
+            if 0 < http.settings.web_slow < elapsed and route not in HELD_ROUTES:
+                logging.warning(f'Slow request: {self.path} took {elapsed:.3f}s, '\
+                        + ', '.join(f'{phase}: {seconds:.3f}s'
+                            for phase, seconds in phases.items())
+                        + f', sent {writer.sent} bytes to {self.client_address[0]}')
+
+    def _get(self):
         '''Process requests and parse their options'''
         if (urlparse(self.path).path == '/graph') and http.db_graphable:
             # Individual Graph
@@ -344,18 +836,45 @@ class _BaseRequestHandler(http.server.BaseHTTPRequestHandler):
                 else:
                     end = parsed_end[0]
                     stamp = f'{start} >> {end}'
-                body = http.rrd.draw_graph(start, end, stamp, graph)
+                body = http.rrd.draw_graph(start, end, stamp, graph,
+                        http.rrd.render_pool.run)
+                if body is None:
+                    self._send_busy()
+                    return
             if len(body) == 0:
                 self.send_error(404, 'Graph unavailable',
                         'Check your parameters and try again,'\
                         'see the "/graphs/" page for examples.')
                 return
-            self._set_png_headers()
+            self._set_png_headers(len(body))
+            self.wfile.write(body)
+        elif (urlparse(self.path).path == '/overview') and http.db_graphable:
+            # All sources on a single graph
+            parsed_start = parse_qs(urlparse(self.path).query).get('start', ['end-1d'])
+            parsed_end = parse_qs(urlparse(self.path).query).get('end', None)
+            start = parsed_start[0]
+            if not parsed_end:
+                end = "now"
+                stamp = f'{start.replace("end","")} >> now'
+            else:
+                end = parsed_end[0]
+                stamp = f'{start} >> {end}'
+            body = http.rrd.draw_overview(start, end, stamp, http.rrd.render_pool.run)
+            if body is None:
+                self._send_busy()
+                return
+            if len(body) == 0:
+                self.send_error(404, 'Overview unavailable',
+                        'Check your parameters and try again,'\
+                        'see the "/graphs/" page for examples.')
+                return
+            self._set_png_headers(len(body))
             self.wfile.write(body)
         elif (urlparse(self.path).path == '/graphs') and http.db_graphable:
             # Graph Index Page
             parsed_start = parse_qs(urlparse(self.path).query).get('start', None)
             parsed_end = parse_qs(urlparse(self.path).query).get('end', None)
+            view = parse_qs(urlparse(self.path).query).get('view', [''])[0]
             if not parsed_start:
                 start = "end-1d"
             else:
@@ -366,22 +885,118 @@ class _BaseRequestHandler(http.server.BaseHTTPRequestHandler):
             else:
                 end = parsed_end[0]
                 stamp = f'{start} >> {end}'
-            self._set_headers()
             response = self._give_head(f" :: graphs {stamp}")
             response += f'<h2><a href="/">{http.settings.name}</a></h2>'
-            response += self._give_graphs(start, end, stamp)
+            response += self._give_graphs(start, end, stamp, view)
             response += self._give_timestamp()
             response += self._give_foot(refresh=300)
             self._write_dedented(response)
+        elif urlparse(self.path).path == '/api/series':
+            # Downsampled time series as json
+            query = parse_qs(urlparse(self.path).query)
+            source = query.get('source', [''])[0]
+            start = query.get('start', ['end-1d'])[0]
+            end = query.get('end', ['now'])[0]
+            try:
+                points = int(query.get('points', [http.settings.graph_wide])[0])
+            except ValueError:
+                points = http.settings.graph_wide
+            points = max(2, min(points, 10000))
+            body = http.rrd.series(source, start, end, points, http.rrd.render_pool.run)
+            if body is None:
+                self._send_busy()
+                return
+            if len(body) == 0:
+                self.send_error(404, 'Series unavailable',
+                        'Check your parameters and try again, '\
+                        'source must be one of the graphed data sources.')
+                return
+            self._send_compressed(body, self._set_json_headers)
+        elif (urlparse(self.path).path == '/api/recent') and http.recent:
+            # Recent readings from memory, as json
+            query = parse_qs(urlparse(self.path).query)
+            sources = query.get('source', [','.join(http.recent.sources())])[0].split(',')
+            try:
+                seconds = float(query.get('seconds', [600])[0])
+            except ValueError:
+                seconds = 600
+            since = time.time() - seconds
+            body = json.dumps({
+                    'update-time': http.data['update-time'],
+                    'sources': {source: http.recent.series(source, since)
+                        for source in sources if source in http.recent.sources()},
+                    }, separators=(',', ':')).encode('utf-8')
+            self._send_compressed(body, self._set_json_headers)
+        elif (urlparse(self.path).path == '/events') and http.events:
+            # Live readings, one long lived event stream per viewer
+            stream = http.events.subscribe()
+            if not stream:
+                self._send_busy()
+                return
+            try:
+                self._set_event_headers()
+                self._write_stream(stream)
+            except (BrokenPipeError, ConnectionResetError):
+                # The viewer went away
+                pass
+            finally:
+                stream.close()
+            self.close_connection = True
+        elif (urlparse(self.path).path == '/metrics') and http.metrics:
+            # Prometheus metrics, rendered once per update
+            encoding = self._choose_encoding(http.metrics.size())
+            body = http.metrics.body(encoding, _compress)
+            self._set_metrics_headers(len(body), encoding)
+            self.wfile.write(body)
+        elif urlparse(self.path).path == '/api/current':
+            # Current readings as json, ?wait=N waits up to N seconds for the
+            #  next data update, or for the update after ?cycle= if given
+            query = parse_qs(urlparse(self.path).query)
+            try:
+                wait = min(max(float(query.get('wait', [0])[0]), 0), MAX_WAIT)
+                cycle = int(query.get('cycle', [http.data.cycle])[0])
+            except ValueError:
+                (wait, cycle) = (0, http.data.cycle)
+            if wait > 0 and http.long_polls:
+                if not http.long_polls.acquire(blocking=False):
+                    http.long_polls_rejected += 1
+                    self._send_busy()
+                    return
+                try:
+                    http.data.wait_cycle(cycle, wait)
+                finally:
+                    http.long_polls.release()
+            self._send_compressed(self._give_current(),
+                    partial(self._set_json_headers, max_age=0))
+        elif urlparse(self.path).path == '/healthz':
+            # Liveness, healthy while data updates are arriving on schedule
+            age = time.time() - http.data['update-time']
+            healthy = age < http.settings.data_interval * 3
+            body = f'{"ok" if healthy else "stale"} {age:.1f}s\n'.encode('ascii')
+            self.send_response(200 if healthy else 503)
+            self.send_header("Content-type", "text/plain")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif urlparse(self.path).path == '/stats':
+            # Request statistics
+            response = self._give_head(" :: stats")
+            response += f'<h2><a href="/" title="Home">{http.settings.name}</a> '\
+                    'Requests</h2>\n'
+            response += self._give_stats()
+            response += self._give_foot(refresh=60)
+            self._write_dedented(response)
         elif urlparse(self.path).path == '/favicon.ico':
             # Favicon
             if not os.path.exists(http.icon_file):
                 self.send_error(404, 'unavailable',
                         f'{http.icon_file} not found.')
             else:
-                self._set_icon_headers()
                 with open(http.icon_file,'rb') as favicon:
-                    self.wfile.write(favicon.read())
+                    icon = favicon.read()
+                self._set_icon_headers(len(icon))
+                self.wfile.write(icon)
         elif ((urlparse(self.path).path == '/' + http.settings.button_url)
                 and (len(http.settings.button_url) > 0)
                 and (http.settings.button_out > 0)):
@@ -392,7 +1007,6 @@ class _BaseRequestHandler(http.server.BaseHTTPRequestHandler):
                 logging.info(f'Web button triggered by: {self.client_address[0]}'\
                             f' with action: {action}')
             status, state = http.button_control(action)
-            self._set_headers()
             response = self._give_head(f" :: {http.settings.button_name}")
             response += f'<h2>{status}</h2>\n'
             invert_state = http.settings.pin_state_names[not state]
@@ -410,57 +1024,70 @@ class _BaseRequestHandler(http.server.BaseHTTPRequestHandler):
             response += self._give_foot()
             self._write_dedented(response)
         elif (urlparse(self.path).path == '/dump_gz') and http.db_dumpable:
-            # Raw dump download
+            # Dump download, shared by all requests until it becomes stale
+            #  range requests allow an interrupted download to be resumed
             start = time.time()
             logging.info(f"RRD database dump requested by {self.client_address[0]}")
-            response = http.rrd.dump()
-            self._set_download_headers(len(response),
-                    f'{http.settings.name}-rrd-{time.strftime("%Y%m%d-%H%M%S")}.xml.gz')
-            self.wfile.write(response)
-            logging.info(f"Dump completed in {(time.time() - start):.2f}s")
+            dump = http.rrd.dump_cache.get()
+            if dump == BUSY:
+                self._send_busy(http.rrd.dump_cache.retry,
+                        b'Database dump being prepared, please retry shortly\n')
+                return
+            if not dump:
+                self.send_error(503, 'Dump unavailable',
+                        'The database could not be dumped, try again later.')
+                return
+            # Opened by the cache, so it is the dump it was tagged as even if replaced since
+            with dump[0] as dumpfile:
+                self._send_file(dumpfile, f'{http.settings.name}-rrd-'\
+                        f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(dump[2]))}.xml.gz')
+            logging.info(f"Dump sent in {(time.time() - start):.2f}s")
         elif (urlparse(self.path).path == '/dump') and http.db_dumpable:
             # Dump warning and link page
-            self._set_headers()
             response = self._give_head(" :: RRD Dump")
             response += self._give_dump_portal()
             response += self._give_foot()
             self._write_dedented(response)
         elif urlparse(self.path).path == '/log':
-            self._set_headers()
-            response = self._give_head()
-            response += f'<h2><a href="/" title="Home">{http.settings.name}</a> Log</h2>\n'
-            response += self._give_log()
-            response += self._give_timestamp()
-            response += self._give_foot(refresh=60, scroll=True)
-            self._write_dedented(response)
+            # Last (lines) of the logs, or a query, the log text itself is not dedented
+            query = {key: value[0] for key, value in
+                    parse_qs(urlparse(self.path).query).items()
+                    if key in ('since', 'until', 'level', 'grep')}
+            head = self._dedent(self._give_head()
+                    + f'<h2><a href="/" title="Home">{http.settings.name}</a> Log</h2>\n'
+                    + self._give_log_head())
+            if query:
+                found = http.log_index.query(parse_when(query.get('since')),
+                        parse_when(query.get('until')), query.get('level'),
+                        query.get('grep'), self._log_lines(1000))
+                foot = self._dedent(self._give_log_foot(len(found), query)
+                        + self._give_timestamp()
+                        + self._give_foot(scroll=True))
+                self._send_compressed(head + escape(''.join(found), quote=False)
+                        .encode('utf-8') + foot, self._set_headers)
+                return
+            lines = self._log_lines()
+            foot = self._dedent(self._give_log_foot(lines)
+                    + self._give_timestamp()
+                    + self._give_foot(refresh=60, scroll=True))
+            log = (escape(block, quote=False) for block in tail(http.settings.log_file, lines))
+            if lines > LOG_STREAM_LINES:
+                # Large logs are streamed straight into the response
+                encoding = self._choose_encoding(http.settings.web_compress_min)
+                self._set_headers(encoding=encoding, stream=True)
+                self._write_stream(chain([head], log, [foot]), encoding)
+            else:
+                self._send_compressed(head + ''.join(log).encode('utf-8') + foot,
+                        self._set_headers)
         elif urlparse(self.path).path == '/':
-            # Main Page
+            # Main Page, rendered once per data generation for each variant
             cam = parse_qs(urlparse(self.path).query).get('cam', None)
             exclude = parse_qs(urlparse(self.path).query).get('exclude', '')
-            exclude = [item for sublist in exclude for item in sublist.split(',')]
-            self._set_headers()
-            response = self._give_head()
-            if not "deco" in exclude:
-                response += f'<h2>{http.settings.name}</h2>\n'
-            if cam and http.settings.cam_url:
-                response += f'<img src="{http.settings.cam_url}" alt="Webcam" '\
-                        f'style="display: block; width: {http.settings.cam_width}%">\n'
-            response += '<table>\n'
-            if not "env" in exclude:
-                response += self._give_env()
-            if not "sys" in exclude:
-                response += self._give_sys()
-            if not "net" in exclude:
-                response += self._give_net()
-            if not "gpio" in exclude:
-                response += self._give_pins()
-            if not "links" in exclude:
-                response += self._give_links()
-            response += '</table>\n'
-            if not "deco" in exclude:
-                response += self._give_timestamp()
-            response += self._give_foot(refresh=60)
-            self._write_dedented(response)
+            exclude = sorted({item for sublist in exclude for item in sublist.split(',')}
+                    & {'deco', 'env', 'sys', 'net', 'gpio', 'links'})
+            cam = bool(cam and http.settings.cam_url)
+            self._write_cached(('main', cam, *exclude),
+                    lambda: self._give_main(cam, exclude))
         else:
             self.send_error(404, 'No Such Page',
                     'Nothing matches the given URL on this server')
@@ -0,0 +1,70 @@
+'''Append-only write-ahead journal for cached RRD updates
+
+provides:
+    Journal: A line oriented journal file with batched fsync
+'''
+
+import os
+import time
+
+class Journal:
+    '''Record cached database update lines so they survive a crash
+
+    Each block of lines in the journal is preceded by a header line giving
+    the update template the lines were generated with, eg:
+        # sys-temp:sys-load:sys-mem
+        1650000000:45.2:0.12:23.1
+
+    Lines are flushed to the OS as they are written, so they survive the
+    process being killed, and fsync()'ed at most once per sync interval so
+    that a power cut loses no more than that interval of readings.
+
+    parameters:
+        path: (str) journal file name
+        sync: (int) maximum time in seconds between fsync() calls
+
+    provides:
+        replay(): returns the (template, [lines]) blocks found in the journal
+        reset(template, lines): truncate and restart the journal
+        append(line): add a line to the journal
+    '''
+
+    def __init__(self, path, sync):
+        self.path = path
+        self.sync = sync
+        self.last_sync = time.monotonic()
+        self.file = open(self.path, 'a+', encoding='ascii')
+
+    def replay(self):
+        '''Return the journal contents as a list of (template, [lines])'''
+        blocks = []
+        self.file.seek(0)
+        for line in self.file:
+            line = line.strip()
+            if line.startswith('# '):
+                blocks.append((line[2:], []))
+            elif line and blocks:
+                blocks[-1][1].append(line)
+        return [block for block in blocks if block[1]]
+
+    def reset(self, template, lines=()):
+        '''Truncate the journal and start a new block, retaining (lines)'''
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(f'# {template}\n')
+        for line in lines:
+            self.file.write(f'{line}\n')
+        self._sync()
+
+    def append(self, line):
+        '''Add a line, fsync() if the sync interval has passed'''
+        self.file.write(f'{line}\n')
+        self.file.flush()
+        if time.monotonic() > self.last_sync + self.sync:
+            self._sync()
+
+    def _sync(self):
+        '''Flush and fsync the journal'''
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
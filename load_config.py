@@ -95,6 +95,16 @@ class Settings:
         self.web_sensor_name = web.get("sensor_name")
         self.web_allow_dump = web.getboolean("allow_dump")
         self.web_show_control = web.getboolean("show_control")
+        self.web_recent = web.getint("recent", 360)
+        self.web_compress_min = web.getint("compress_min", 1024)
+        self.web_events = web.getint("events", 16)
+        self.web_long_polls = web.getint("long_polls", 8)
+        self.web_metrics = web.getboolean("metrics", True)
+        self.web_slow = web.getfloat("slow_request", 0)
+        self.web_server = web.get("server", "threaded").strip().lower()
+        self.web_connections = web.getint("connections", 32)
+        self.web_timeout = web.getint("timeout", 30)
+        self.web_keepalive = web.getint("keepalive", 15)
 
         graph = config["graph"]
         self.graph_durations = graph.get("durations").split(',')
@@ -105,6 +115,12 @@ class Settings:
         self.graph_area_color = graph.get("area_color")
         self.graph_area_depth = graph.get("area_depth")
         self.graph_half_height = graph.get("half_height").split(',')
+        self.graph_in_process = graph.getboolean("in_process", True)
+        self.graph_cache_size = graph.getint("cache_size", 4096) * 1024
+        self.graph_timings = graph.getboolean("timings", False)
+        self.graph_workers = graph.getint("workers", 0)
+        self.graph_queue = graph.getint("queue", 8)
+        self.graph_retry = graph.getint("retry", 5)
 
         self.pin_map = {}
         for pin in config["pins"]:
@@ -128,10 +144,17 @@ class Settings:
                     self.button_name = name
 
         intervals = config["intervals"]
-        self.pin_interval = intervals.getint("pin")
+        self.pin_interval = intervals.getfloat("pin")
         self.data_interval = intervals.getint("data")
         self.rrd_interval = intervals.getint("rrd")
         self.net_timeout = min(intervals.getfloat("ping"),self.data_interval-0.5)
+        self.scheduler = intervals.get("scheduler", "timers")
+        # Blank collector intervals follow the data interval
+        self.system_interval = float(intervals.get("system") or self.data_interval)
+        self.sensors_interval = float(intervals.get("sensors") or self.data_interval)
+        self.net_interval = float(intervals.get("net") or self.data_interval)
+        self.stage_window = intervals.getint("stage_window", 0)
+        self.cycle_warn = intervals.getfloat("cycle_warn", 0.5)
 
         log = config["log"]
         self.log_file_dir = log.get("file_dir")
@@ -147,6 +170,11 @@ class Settings:
         self.rrd_backup_count = rrd.getint("backup_count")
         self.rrd_backup_age = int(abs(rrd.getfloat("backup_age")) * 86400)
         self.rrd_backup_time = rrd.get("backup_time")
+        self.rrd_backup_nice = rrd.getboolean("backup_nice", True)
+        self.rrd_journal = rrd.getboolean("journal", False)
+        self.rrd_journal_sync = rrd.getint("journal_sync", 30)
+        self.rrd_daemon = rrd.get("daemon", "")
+        self.rrd_dump_stale = int(rrd.getfloat("dump_stale", 60) * 60)
 
         display = config["display"]
         self.display_rotate = display.getboolean("rotate")
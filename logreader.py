@@ -0,0 +1,260 @@
+'''Read the most recent lines from the (rotated) SBCEye log files
+
+provides:
+    log_files(log_file): list the log file and its rotated copies, newest first
+    tail(log_file, lines): generator giving the last (lines) lines as text
+    LogIndex: an incremental index of the logs for time, level and text queries
+    parse_when(text): convert a query time into epoch seconds
+
+The files are read backwards from the end in blocks to find where the
+requested lines start, older rotated files are only opened if the newer ones
+do not contain enough lines. The cost is proportional to the number of lines
+requested, not the total size of the logs.
+'''
+
+import os
+import re
+import time
+import codecs
+from collections import deque
+from datetime import datetime
+from glob import glob, escape
+from threading import Lock
+
+READ_BLOCK = 65536
+
+def log_files(log_file):
+    '''Return the log file and its rotated backups (log.1, log.2, ..) newest first'''
+    log_file = str(log_file)
+    rotated = []
+    for name in glob(f'{escape(log_file)}.*'):
+        suffix = name[len(log_file) + 1:]
+        if suffix.isdigit():
+            rotated.append((int(suffix), name))
+    files = [name for _, name in sorted(rotated)]
+    if os.path.isfile(log_file):
+        files.insert(0, log_file)
+    return files
+
+def _tail_start(files, lines):
+    '''Find where the last (lines) lines begin, searching backwards
+
+    parameters:
+        files: (list) log files, newest first
+        lines: (int) number of lines wanted
+
+    returns:
+        (index, offset): index into files, and byte offset in that file
+    '''
+    found = 0
+    for index, path in enumerate(files):
+        with open(path, 'rb') as log:
+            end = log.seek(0, os.SEEK_END)
+            if index == 0 and end > 0:
+                # the final newline of the newest file does not start a line
+                log.seek(end - 1)
+                if log.read(1) == b'\n':
+                    end -= 1
+            position = end
+            while position > 0:
+                size = min(READ_BLOCK, position)
+                position -= size
+                log.seek(position)
+                block = log.read(size)
+                newline = len(block)
+                while True:
+                    newline = block.rfind(b'\n', 0, newline)
+                    if newline < 0:
+                        break
+                    found += 1
+                    if found == lines:
+                        return index, position + newline + 1
+    return len(files) - 1, 0
+
+def tail(log_file, lines):
+    '''Generator, yields the last (lines) lines of the logs as text blocks,
+    oldest first, so they can be streamed straight into a response'''
+    files = log_files(log_file)
+    if not files or lines < 1:
+        return
+    (index, offset) = _tail_start(files, lines)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for path in reversed(files[:index + 1]):
+        try:
+            with open(path, 'rb') as log:
+                log.seek(offset)
+                while True:
+                    block = log.read(READ_BLOCK)
+                    if not block:
+                        break
+                    yield decoder.decode(block)
+        except FileNotFoundError:
+            # rotated away while we were reading
+            pass
+        offset = 0
+    yield decoder.decode(b'', final=True)
+
+# Log levels, in increasing order of severity
+LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+ENTRY = re.compile(rb'^(.*?) (DEBUG|INFO|WARNING|ERROR|CRITICAL): ')
+# Maximum number of lines in an index bucket
+BUCKET_LINES = 256
+
+class LogIndex:
+    '''Incremental index of the log files for time, level and text queries
+
+    Each file is split into buckets of up to BUCKET_LINES lines, recording
+    the byte range, first and last timestamps and the levels present in each.
+    Files are tracked by inode so the index survives log rotation, and only
+    the newly written part of a file is read when the index is refreshed.
+    Queries only read the buckets that can contain matching lines.
+
+    parameters:
+        log_file: (str) the log file name, rotated copies are found automatically
+        time_format: (str) time.strftime() format used for the log timestamps
+
+    provides:
+        query(since, until, level, grep, limit): returns matching log lines
+    '''
+
+    def __init__(self, log_file, time_format):
+        self.log_file = log_file
+        self.time_format = time_format
+        self.files = {}  # inode: {'size': indexed bytes, 'buckets': [..]}
+        self.lock = Lock()
+
+    def _parse_time(self, stamp):
+        '''Convert a log timestamp to epoch seconds, None if unparseable'''
+        try:
+            return time.mktime(time.strptime(stamp.decode('utf-8'), self.time_format))
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    def _index_file(self, path, entry):
+        '''Index any new lines in a file, adding buckets to the entry'''
+        with open(path, 'rb') as log:
+            log.seek(entry['size'])
+            offset = entry['size']
+            buckets = entry['buckets']
+            # Continue filling the last bucket if it has room
+            bucket = buckets.pop() if buckets and buckets[-1]['lines'] < BUCKET_LINES else None
+            for line in log:
+                if not line.endswith(b'\n'):
+                    break  # partially written line, index it next time
+                if bucket is None:
+                    bucket = {'start': offset, 'end': offset, 'lines': 0,
+                            'first': None, 'last': None, 'levels': set()}
+                match = ENTRY.match(line)
+                if match:
+                    if bucket['first'] is None:
+                        bucket['first'] = self._parse_time(match.group(1))
+                    bucket['last_stamp'] = match.group(1)
+                    bucket['levels'].add(match.group(2).decode('ascii'))
+                offset += len(line)
+                bucket['end'] = offset
+                bucket['lines'] += 1
+                if bucket['lines'] >= BUCKET_LINES:
+                    self._close_bucket(bucket)
+                    buckets.append(bucket)
+                    bucket = None
+            if bucket is not None:
+                self._close_bucket(bucket)
+                buckets.append(bucket)
+            entry['size'] = offset
+
+    def _close_bucket(self, bucket):
+        '''Set the last timestamp of a bucket'''
+        if bucket.get('last_stamp'):
+            bucket['last'] = self._parse_time(bucket['last_stamp'])
+
+    def refresh(self):
+        '''Bring the index up to date with the log files
+        returns the files as a list of (path, buckets), oldest first'''
+        current = []
+        with self.lock:
+            for path in reversed(log_files(self.log_file)):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entry = self.files.get(stat.st_ino)
+                if entry is None or stat.st_size < entry['size']:
+                    entry = {'size': 0, 'buckets': []}
+                    self.files[stat.st_ino] = entry
+                if stat.st_size > entry['size']:
+                    self._index_file(path, entry)
+                current.append((stat.st_ino, path))
+            # Forget files that have been rotated away
+            for inode in set(self.files) - {inode for inode, _ in current}:
+                del self.files[inode]
+            return [(path, list(self.files[inode]['buckets'])) for inode, path in current]
+
+    def query(self, since=None, until=None, level=None, grep=None, limit=1000):
+        '''Return up to (limit) of the most recent log lines matching all of:
+            since, until: (float) epoch time range
+            level: (str) minimum log level
+            grep: (str) case insensitive text to search for
+        continuation lines (eg tracebacks) go with the entry they follow'''
+        levels = set(LEVELS[LEVELS.index(level):]) if level in LEVELS else None
+        needle = grep.lower().encode('utf-8') if grep else None
+        found = deque(maxlen=limit)
+        # Whether the entry being read passed, carried from bucket to bucket so
+        #  that continuation lines stay with their entry; lines before the first
+        #  entry are only kept if there are no entry filters
+        keep = not (levels or since or until)
+        for path, buckets in self.refresh():
+            try:
+                log = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with log:
+                for bucket in buckets:
+                    # Skip buckets whose entries all fail, a bucket of only
+                    #  continuation lines has no levels and is never skipped
+                    if (levels and bucket['levels'] and not levels & bucket['levels']) \
+                            or (since and bucket['last'] and bucket['last'] < since) \
+                            or (until and bucket['first'] and bucket['first'] > until):
+                        keep = False
+                        continue
+                    log.seek(bucket['start'])
+                    block = log.read(bucket['end'] - bucket['start'])
+                    keep = self._filter(block, (since, until, levels, needle), found, keep)
+        return [line.decode('utf-8', errors='replace') for line in found]
+
+    def _filter(self, block, filters, found, keep):
+        '''Add the lines in a block that pass the filters to found, (keep) is
+        whether the entry the block starts within passed
+        returns whether the last entry in the block passed'''
+        (since, until, levels, needle) = filters
+        for line in block.splitlines(keepends=True):
+            match = ENTRY.match(line)
+            if match:
+                keep = True
+                if levels and match.group(2).decode('ascii') not in levels:
+                    keep = False
+                if keep and (since or until):
+                    stamp = self._parse_time(match.group(1))
+                    if stamp is None or (since and stamp < since) \
+                            or (until and stamp > until):
+                        keep = False
+            if keep and (not needle or needle in line.lower()):
+                found.append(line)
+        return keep
+
+def parse_when(text):
+    '''Convert a query time into epoch seconds, returns None if invalid
+    accepts: epoch seconds, an ISO date/time, or an age such as 30m, 6h, 2d'''
+    if not text:
+        return None
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    if text[-1:] in units and text[:-1].isdigit():
+        return time.time() - int(text[:-1]) * units[text[-1]]
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
@@ -0,0 +1,131 @@
+'''Prometheus text exposition of the SBCEye readings and internals
+
+provides:
+    Metrics: renders the data{} dictionary, and some internal counters, as
+        Prometheus metrics once per update, for '/metrics' to serve as-is
+'''
+
+import re
+from math import isnan, isinf
+
+# Metric names and help for the known readings
+READINGS = {
+        'env-temp': ('sbceye_environment_temperature_celsius', 'Environmental sensor temperature'),
+        'env-humi': ('sbceye_environment_humidity_percent', 'Environmental sensor humidity'),
+        'env-pres': ('sbceye_environment_pressure_hpa', 'Environmental sensor pressure'),
+        'sys-temp': ('sbceye_cpu_temperature_celsius', 'CPU temperature'),
+        'sys-load': ('sbceye_load1', 'One minute load average'),
+        'sys-freq': ('sbceye_cpu_frequency_mhz', 'CPU frequency'),
+        'sys-mem': ('sbceye_memory_used_percent', 'Memory used'),
+        'sys-disk': ('sbceye_disk_used_percent', 'Root filesystem used'),
+        'sys-proc': ('sbceye_processes', 'Number of processes'),
+        'sys-net-io': ('sbceye_network_io_kilobytes_per_second', 'Network traffic, sent and received'),
+        'sys-disk-io': ('sbceye_disk_io_kilobytes_per_second', 'Disk traffic, read and written'),
+        'sys-cpu-int': ('sbceye_soft_interrupts_per_second', 'Soft interrupt rate'),
+        'update-time': ('sbceye_update_time_seconds', 'Time of the latest readings'),
+        }
+# Families of readings, the rest of the key becomes a label
+FAMILIES = {
+        'net-': ('sbceye_ping_milliseconds', 'target', 'Ping response time, NaN if failed'),
+        'pin-': ('sbceye_pin_state', 'pin', 'GPIO pin state'),
+        }
+
+def _value(value):
+    '''A sample value in exposition format, unknown ('U') values are NaN'''
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 'NaN'
+    if isnan(value):
+        return 'NaN'
+    if isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+def _label(value):
+    '''Escape a label value'''
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _name(key):
+    '''A metric name for an unrecognised reading'''
+    return 'sbceye_' + re.sub(r'[^a-zA-Z0-9_]', '_', key)
+
+class Metrics:
+    '''Render the readings and internal counters in the Prometheus text format
+
+    The text is rendered once whenever the data changes and then served
+    unchanged, compressed forms are made (once) when first requested.
+
+    parameters:
+        rrd: the Robin database instance, for the cache and write counters
+        timings: (dict) stage: seconds, durations of the latest collection stages
+
+    provides:
+        render(data): render the metrics, if the data has changed
+        body(encoding, compress): returns the rendered text, compressed if requested
+        size(): returns the uncompressed size of the rendered text
+    '''
+
+    def __init__(self, rrd, timings):
+        self.rrd = rrd
+        self.timings = timings
+        self.generation = None
+        self.variants = {None: b''}
+
+    def render(self, data):
+        '''Render the metrics text, unless the data has not changed since
+        it was last rendered'''
+        if data.generation == self.generation:
+            return
+        lines = []
+        families = {}
+        for key, value in list(data.items()):
+            if key in READINGS:
+                (name, description) = READINGS[key]
+                self._metric(lines, name, description, [('', value)])
+            elif key[0:4] in FAMILIES:
+                families.setdefault(key[0:4], []).append((key[4:], value))
+            else:
+                self._metric(lines, _name(key), f'SBCEye reading {key}', [('', value)])
+        for prefix, samples in families.items():
+            (name, label, description) = FAMILIES[prefix]
+            self._metric(lines, name, description,
+                    [(f'{label}="{_label(item)}"', value) for item, value in samples])
+        self._internals(lines)
+        self.variants = {None: '\n'.join(lines).encode('utf-8') + b'\n'}
+        self.generation = data.generation
+
+    def _internals(self, lines):
+        '''The SBCEye internal counters'''
+        self._metric(lines, 'sbceye_rrd_cache_length',
+                'Readings cached and waiting to be written to the database',
+                [('', len(self.rrd.cache))])
+        self._metric(lines, 'sbceye_rrd_last_write_time_seconds',
+                'Time the database was last written', [('', self.rrd.generation_time)])
+        self._metric(lines, 'sbceye_rrd_writes_total',
+                'Database writes since starting', [('', self.rrd.generation)], 'counter')
+        self._metric(lines, 'sbceye_update_duration_seconds',
+                'Duration of the latest update',
+                [(f'job="{_label(job)}"', seconds) for job, seconds in list(self.timings.items())])
+
+    def _metric(self, lines, name, description, samples, kind='gauge'):
+        '''Append a metric family, samples are a list of (labels, value)'''
+        if not samples:
+            return
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            labels = f'{{{labels}}}' if labels else ''
+            lines.append(f'{name}{labels} {_value(value)}')
+
+    def body(self, encoding=None, compress=None):
+        '''The rendered text, compressed by compress(text, encoding) when an
+        encoding is given, the compressed text is kept for later requests'''
+        variants = self.variants
+        if encoding not in variants:
+            variants[encoding] = compress(variants[None], encoding)
+        return variants[encoding]
+
+    def size(self):
+        '''Size of the uncompressed text'''
+        return len(self.variants[None])
@@ -0,0 +1,135 @@
+'''Low overhead system readings from /proc for the SBCEye project
+
+provides:
+    ProcSampler: reads the load, process count, memory use and the network,
+        disk and soft interrupt counters from files in /proc that are kept
+        open and re-read into reused buffers
+    PsutilSampler: the same readings via psutil, for systems without /proc
+'''
+
+import os
+import psutil
+
+# Initial read buffer size, buffers grow as needed
+BUFFER_SIZE = 4096
+# /proc/diskstats counts sectors of 512 bytes, whatever the device
+SECTOR_SIZE = 512
+
+class ProcSampler:
+    '''Sample the system readings directly from /proc
+
+    The files are opened once and re-read from the start with preadv() into
+    a reused buffer for each, only the fields needed are parsed.
+
+    parameters:
+        proc: (str) the proc filesystem mount point, default '/proc'
+
+    provides:
+        sample(): returns a dict with:
+            load: one minute load average
+            procs: number of tasks (processes and threads), from /proc/loadavg
+            mem: percentage of memory used (total - available)
+            net: total bytes received and sent by all interfaces
+            disk: total bytes read and written by all (whole) disks
+            soft_interrupts: soft interrupts since boot
+    '''
+
+    def __init__(self, proc='/proc'):
+        self.files = {}
+        for name, path in {'stat': 'stat', 'loadavg': 'loadavg', 'meminfo': 'meminfo',
+                'net': 'net/dev', 'disk': 'diskstats'}.items():
+            self.files[name] = (os.open(f'{proc}/{path}', os.O_RDONLY),
+                    bytearray(BUFFER_SIZE))
+        # Whole disks (as opposed to partitions), by name
+        self.disks = {}
+
+    def _read(self, name):
+        '''Re-read a file from the start into its buffer
+        returns (buffer, size), only the first (size) bytes are current'''
+        (handle, buffer) = self.files[name]
+        while True:
+            size = os.preadv(handle, [buffer], 0)
+            if size < len(buffer):
+                return buffer, size
+            # Did not fit, grow the buffer and try again
+            buffer.extend(bytes(len(buffer)))
+
+    def _is_disk(self, name):
+        '''True for whole disks (and virtual devices), not partitions, as psutil'''
+        if name not in self.disks:
+            self.disks[name] = os.path.exists(
+                    f'/sys/block/{name.decode("ascii", "replace").replace("/", "!")}')
+        return self.disks[name]
+
+    def sample(self):
+        '''Return the current readings'''
+        (buffer, size) = self._read('loadavg')
+        fields = buffer[:size].split()
+        readings = {
+                'load': float(fields[0]),
+                'procs': int(fields[3].split(b'/')[1]),
+                }
+
+        # /proc/stat has a very long 'intr' line, so search it in place
+        (buffer, size) = self._read('stat')
+        start = buffer.find(b'\nsoftirq ', 0, size) + 9
+        readings['soft_interrupts'] = int(buffer[start:buffer.find(b' ', start, size)])
+
+        (buffer, size) = self._read('meminfo')
+        total = _field(buffer, size, b'MemTotal:')
+        available = _field(buffer, size, b'MemAvailable:')
+        if available is None:
+            available = _field(buffer, size, b'MemFree:')
+        readings['mem'] = round((total - available) / total * 100, 1)
+
+        count = 0
+        (buffer, size) = self._read('net')
+        for line in buffer[:size].splitlines()[2:]:
+            values = line[line.rfind(b':') + 1:].split()
+            count += int(values[0]) + int(values[8])
+        readings['net'] = count
+
+        count = 0
+        (buffer, size) = self._read('disk')
+        for line in buffer[:size].splitlines():
+            values = line.split()
+            if (len(values) == 14 or len(values) >= 18) and self._is_disk(bytes(values[2])):
+                count += int(values[5]) + int(values[9])
+        readings['disk'] = count * SECTOR_SIZE
+        return readings
+
+    def close(self):
+        '''Close the files'''
+        for handle, _ in self.files.values():
+            os.close(handle)
+        self.files = {}
+
+def _field(buffer, size, name):
+    '''Integer value of a named field in /proc/meminfo, None if missing'''
+    start = buffer.find(name, 0, size)
+    if start < 0:
+        return None
+    return int(buffer[start + len(name):buffer.find(b'\n', start, size)].split()[0])
+
+class PsutilSampler:
+    '''The same readings as ProcSampler, via psutil
+
+    provides:
+        sample(): returns a dict, as ProcSampler.sample()
+    '''
+
+    def sample(self):
+        '''Return the current readings'''
+        net = psutil.net_io_counters()
+        disk = psutil.disk_io_counters()
+        return {
+                'load': psutil.getloadavg()[0],
+                'procs': len(psutil.pids()),
+                'mem': psutil.virtual_memory().percent,
+                'net': net.bytes_sent + net.bytes_recv,
+                'disk': disk.read_bytes + disk.write_bytes,
+                'soft_interrupts': psutil.cpu_stats().soft_interrupts,
+                }
+
+    def close(self):
+        '''Nothing to close'''
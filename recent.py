@@ -0,0 +1,77 @@
+'''In-memory ring buffers of the most recent readings
+
+provides:
+    Recent: A fixed size, array backed, ring buffer per data source
+'''
+
+from array import array
+from math import isnan
+from threading import Lock
+import time
+
+class Recent:
+    '''Keep the last (length) readings of each source in memory
+
+    All storage is preallocated when the class is created, values are held
+    as float32 and timestamps as float64, so memory use is fixed at
+    12 bytes per sample per source. Unknown ('U') readings are held as NaN.
+
+    parameters:
+        sources: (list) names of the data sources to record
+        length: (int) number of readings to keep per source
+
+    provides:
+        record(source, value): add a reading, ignored for unknown sources
+        series(source, since): returns [[time, value], ..] newer than since
+        size(): returns the memory used by the buffers in bytes
+    '''
+
+    def __init__(self, sources, length):
+        self.length = length
+        self.values = {}
+        self.times = {}
+        self.heads = {}
+        self.counts = {}
+        for source in sources:
+            self.values[source] = array('f', [float('nan')]) * length
+            self.times[source] = array('d', [0]) * length
+            self.heads[source] = 0
+            self.counts[source] = 0
+        self.lock = Lock()
+
+    def record(self, source, value, stamp=None):
+        '''Add a reading for source, stamped with the current time by default'''
+        if source not in self.values:
+            return
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = float('nan')
+        with self.lock:
+            head = self.heads[source]
+            self.values[source][head] = value
+            self.times[source][head] = time.time() if stamp is None else stamp
+            self.heads[source] = (head + 1) % self.length
+            self.counts[source] = min(self.counts[source] + 1, self.length)
+
+    def series(self, source, since=0):
+        '''Return the readings for source newer than since, oldest first
+        as a list of [time, value] pairs, value is None where unknown'''
+        if source not in self.values:
+            return []
+        with self.lock:
+            count = self.counts[source]
+            first = (self.heads[source] - count) % self.length
+            indexes = [(first + i) % self.length for i in range(count)]
+            return [[self.times[source][i],
+                    None if isnan(self.values[source][i]) else round(self.values[source][i], 3)]
+                    for i in indexes if self.times[source][i] > since]
+
+    def sources(self):
+        '''The list of recorded sources'''
+        return list(self.values.keys())
+
+    def size(self):
+        '''Memory used by the buffers, in bytes'''
+        return sum(len(values) * values.itemsize + len(self.times[source]) *
+                self.times[source].itemsize for source, values in self.values.items())
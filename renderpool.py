@@ -0,0 +1,92 @@
+'''Bounded worker pool for graph rendering and database fetches
+
+provides:
+    RenderPool: A fixed size thread pool with a bounded queue and admission control
+'''
+
+import os
+import time
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, BoundedSemaphore
+from timing import add_time
+
+class RenderPool:
+    '''Run render jobs on a fixed number of worker threads
+
+    At most (workers + queue) jobs are admitted at any time, further jobs are
+    refused immediately so that the caller can return a fast 'busy' response
+    rather than piling more work onto an overloaded machine.
+
+    parameters:
+        workers: (int) number of worker threads, 0 = one per cpu core
+        queue: (int) number of jobs that may wait for a free worker
+
+    provides:
+        run(func, *args): run func(*args) in the pool and return the result,
+            or None if the pool is saturated
+        stats(): returns a dict of queue and timing counters
+    '''
+
+    def __init__(self, workers, queue):
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.queue = queue
+        self.slots = BoundedSemaphore(self.workers + self.queue)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                thread_name_prefix='sbceye_render')
+        self.lock = Lock()
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0
+        self.wait_max = 0
+        self.wait_last = 0
+
+    def run(self, func, *args):
+        '''Run func(*args) on a worker, blocks until complete
+        returns the result, or None if the pool is saturated'''
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            return None
+        try:
+            with self.lock:
+                self.waiting += 1
+            # Run in a copy of our context, so the job is accounted to the request
+            return self.executor.submit(copy_context().run, self._job,
+                    time.monotonic(), func, args).result()
+        finally:
+            self.slots.release()
+
+    def _job(self, submitted, func, args):
+        '''Runs on a worker thread, records the queue wait and runs the job'''
+        wait = time.monotonic() - submitted
+        with self.lock:
+            self.waiting -= 1
+            self.active += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.wait_last = wait
+        add_time('queue', wait)
+        try:
+            return func(*args)
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.completed += 1
+
+    def stats(self):
+        '''Return the pool counters, wait times are in seconds'''
+        with self.lock:
+            return {
+                    'workers': self.workers,
+                    'queue': self.queue,
+                    'waiting': self.waiting,
+                    'active': self.active,
+                    'completed': self.completed,
+                    'rejected': self.rejected,
+                    'wait_mean': self.wait_total / max(1, self.completed + self.active),
+                    'wait_max': self.wait_max,
+                    'wait_last': self.wait_last,
+                    }
@@ -7,17 +7,36 @@ import time
 from pathlib import Path
 import logging
 import gzip
+import json
+import zlib
 import subprocess
 import os
-from shutil import which
+import fcntl
+from shutil import which, copyfileobj
+from tempfile import mkstemp
 from threading import Thread, Lock, local
-import schedule
 import rrdtool
 
+# Local classes
+from graphcache import GraphCache
+from journal import Journal
+from series import downsample
+from renderpool import RenderPool
+from timing import timed
+from dumpcache import DumpCache
+
 # Dump and graph operations are run multithreaded by the httpServer, and backups
 #  are also threaded. We need some mutex locks for them
 db_lock = Lock()
-dump_local = local()
+# The update cache is appended by the scheduler and emptied by any thread
+cache_lock = Lock()
+
+# Line colours for the overview graph
+OVERVIEW_COLORS = ['#00A0A0', '#A00000', '#0000C0', '#A06000',
+        '#008000', '#8000A0', '#606060', '#C000A0']
+
+# ioctl request number to reflink (clone) a file on Linux
+FICLONE = 0x40049409
 graph_local = local()
 
 class Robin:
@@ -36,6 +55,9 @@ class Robin:
         self.graph_args["area_color"] = s.graph_area_color
         self.graph_args["area_depth"] = s.graph_area_depth
         self.half_height = s.graph_half_height
+        self.in_process = s.graph_in_process
+        self.graph_timings = s.graph_timings
+        self.step = 10
 
 
         # Sensor and system sources with limits (min,max)
@@ -95,6 +117,14 @@ class Robin:
                     f'0 = {s.pin_state_names[0]}, 1 = {s.pin_state_names[1]}',
                     '1', '0' ,'%3.1lf', '%3.0lf', '--alt-autoscale', '--units-exponent','0')
 
+        # collection stage timings, see StageTimes
+        for source in data.keys():
+            if source.startswith('time-'):
+                (stage, stat) = source[5:].rsplit('-', 1)
+                self.data_sources[source] = ('0','U')
+                self.graph_map[source] = (f'{stage} stage time, {stat}, milliseconds',
+                        None, '0', '%5.0lf', '%5.1lf ms', '--units-exponent','0')
+
         # set the list of active and storable sources
         self.template= ''
         self.sources = []
@@ -110,6 +140,15 @@ class Robin:
         self.backup_age = s.rrd_backup_age
         self.backup_time = s.rrd_backup_time
 
+        # Compress backups in a low priority child process if possible
+        self.backup_command = None
+        if s.rrd_backup_nice and which('gzip'):
+            self.backup_command = ['gzip', '-6', '-n', '-c']
+            if which('ionice'):
+                self.backup_command = ['ionice', '-c', '3', *self.backup_command]
+            if which('nice'):
+                self.backup_command = ['nice', '-n', '19', *self.backup_command]
+
         # File paths
         db_path = Path(f'{s.rrd_dir}').resolve()
         self.db_file = Path(f'{s.rrd_dir}/{s.rrd_file_name}').resolve()
@@ -142,7 +181,7 @@ class Robin:
                 print(f'Importing from previous {source_file}')
                 args.append(["--source",str(source_file)])
             args.append(["--start", "now-10s",
-                    "--step", "10s",
+                    "--step", f"{self.step}s",
                     "RRA:AVERAGE:0.5:1:181440",    # 3 weeks per 10s
                     "RRA:AVERAGE:0.5:6:133920",    # 3 months per minute
                     "RRA:AVERAGE:0.5:360:158112"]) # 3 years per hour
@@ -150,11 +189,30 @@ class Robin:
         else:
             print(f'Using existing: {str(self.db_file)}')
 
-        # get a list of existing data sources in the database
+        # Optionally use a rrdcached daemon for updates, graphs and fetches
+        self.daemon = s.rrd_daemon
+        self.daemon_args = []
+        if self.daemon:
+            try:
+                rrdtool.flushcached('--daemon', self.daemon, str(self.db_file))
+                self.daemon_args = ['--daemon', self.daemon]
+                print(f'Using rrdcached daemon: {self.daemon}')
+                logging.info(f'RRD updates via rrdcached daemon: {self.daemon}')
+            except rrdtool.OperationalError as rrd_error:
+                print(f'rrdcached daemon unavailable, using direct database access:\n{rrd_error}')
+                logging.warning(f'rrdcached daemon {self.daemon} unavailable')
+                self.daemon = None
+
+        # get a list of existing data sources and archive resolutions in the database
         existing_sources = []
-        for key in rrdtool.info(str(self.db_file)):
+        self.rra_steps = set()
+        db_info = rrdtool.info(str(self.db_file))
+        for key in db_info:
             if key[:2] == 'ds' and key[-6:] == '.index':
                 existing_sources.append(key[3:-7])
+            if key[:3] == 'rra' and key[-12:] == '.pdp_per_row':
+                self.rra_steps.add(db_info[key] * db_info['step'])
+        self.rra_steps = sorted(self.rra_steps)
 
         # create any missing data sources in the database
         for source in self.sources:
@@ -166,18 +224,76 @@ class Robin:
                     str(self.db_file),
                     f"DS:{source}:GAUGE:60:{mini}:{maxi}")
 
+        # rrdcached does not accept update templates; updates must give every
+        #  data source in the database in order, so record that order
+        self.ds_order = sorted(existing_sources, key=lambda ds: db_info[f'ds[{ds}].index'])
+        self.ds_order.extend(source for source in self.sources if source not in existing_sources)
+
         # Disable dumping if rrdtool not in path
         self.rrdtool = which("rrdtool")
         if self.rrdtool:
             print(f'Commandline rrdtool: {self.rrdtool}')
         else:
-            print('No commandline rrdtool available, ' + 'graphing and dumping disabled')
+            print('No commandline rrdtool available, dumping disabled')
+
+        # Graphs are rendered in-process by the bindings where possible,
+        #  the commandline tool is used as a fallback
+        if self.in_process and not hasattr(rrdtool, 'graphv'):
+            print('RRDTool bindings do not provide graphv(), in-process graphing disabled')
+            self.in_process = False
+        self.graphable = bool(self.in_process or self.rrdtool)
+        if self.in_process:
+            print('Graphs will be rendered in-process')
+        elif self.rrdtool:
+            print('Graphs will be rendered via the commandline rrdtool')
+        else:
+            print('No graph renderer available, graphing disabled')
 
         # Use a home-brew local cache
         self.cache = []
         self.last_write = 0
         self.cache_age = s.rrd_interval
 
+        # Optionally journal the cache so that it survives a crash or power loss
+        #  not needed with rrdcached, which keeps its own journal
+        self.journal = None
+        if s.rrd_journal and not self.daemon:
+            self.journal = Journal(f'{str(self.db_file)}.journal', s.rrd_journal_sync)
+            for template, lines in self.journal.replay():
+                print(f'Replaying {len(lines)} journalled updates into database')
+                try:
+                    rrdtool.update(
+                            str(self.db_file),
+                            "--template", template,
+                            "--skip-past-updates",
+                            *lines)
+                except rrdtool.OperationalError as rrd_error:
+                    print("RRDTool journal replay error:")
+                    print(rrd_error)
+            self.journal.reset(self.template)
+            print(f'Update journal enabled: {self.journal.path}')
+
+        # Database write generation, incremented whenever the cache is written
+        self.generation = 0
+        self.generation_time = time.time()
+
+        # Rendered graphs are cached until the data or time window changes
+        self.graph_cache = None
+        if s.graph_cache_size > 0:
+            self.graph_cache = GraphCache(s.graph_cache_size)
+            print(f'Graph cache enabled: {s.graph_cache_size} bytes')
+
+        # Web dumps are generated once and shared until the data changes
+        self.dump_cache = None
+        if self.rrdtool:
+            self.dump_cache = DumpCache(self, f'{str(self.db_file)}.dump.xml.gz',
+                    s.rrd_dump_stale)
+
+        # Renders and fetches requested via the web are run in a bounded pool
+        self.render_pool = RenderPool(s.graph_workers, s.graph_queue)
+        print(f'Render pool: {self.render_pool.workers} workers, '\
+                f'{self.render_pool.queue} queued')
+
         # Notify
         print('RRD database and cache configured and enabled')
         logging.info(f'RRD database is: {str(self.db_file)}')
@@ -186,22 +302,34 @@ class Robin:
     def _backup(self):
         '''Backup and rotate old backups'''
         if self.backup_count > 0:
-            # Copy to a timestamped file
+            # Snapshot under the db lock, then compress to a timestamped file
             self.write_updates()
             suffix = time.strftime("%Y-%m-%d.%H:%M:%S.gz")
-            if not db_lock.acquire(blocking=True, timeout=600):
+            backup_file = f'{str(self.backup_path)}/{self.backup_name}.{suffix}'
+            start = time.time()
+            snapshot, held, _ = self._snapshot(600)
+            if not snapshot:
                 print('Error: Backup failed, could not acquire db lock within 600s')
                 return
-            start = time.time()
-            with open(f'{self.db_file}', 'rb') as dbfile:
-                with gzip.GzipFile(
-                        f'{str(self.backup_path)}/{self.backup_name}.{suffix}',
-                        mode = 'wb', compresslevel = 6) as zipfile:
-                    zipfile.write(dbfile.read())
-            db_lock.release()
+            try:
+                with open(backup_file, 'wb') as zipfile:
+                    if self.backup_command:
+                        subprocess.run([*self.backup_command, snapshot],
+                                stdout=zipfile, check=True)
+                    else:
+                        with open(snapshot, 'rb') as dbfile, gzip.GzipFile(
+                                fileobj=zipfile, mode='wb', compresslevel=6) as gzfile:
+                            copyfileobj(dbfile, gzfile, 1048576)
+            except (OSError, subprocess.CalledProcessError) as backup_error:
+                print(f'Error: Backup failed: {backup_error}')
+                if os.path.exists(backup_file):
+                    os.remove(backup_file)
+                return
+            finally:
+                os.remove(snapshot)
             #logging.info(f'Database backup saved as: {self.backup_name}.{suffix}')
             print(f'Database backup saved as: {self.backup_name}.{suffix} '\
-                    f'(took: {(time.time() - start):.2f}s)')
+                    f'(lock held: {held:.3f}s, took: {(time.time() - start):.2f}s)')
 
             # Process old backups
             now = time.time()
@@ -222,123 +350,424 @@ class Robin:
                     #logging.info(f'Removed stale backup: {name}')
                     print(f'Removed stale backup: {name}')
 
-    def start_backups(self):
-        '''Add the backup schedule job'''
+    def start_backups(self, timers):
+        '''Add the backup job to the scheduler (timers)'''
         # Start the backup schedule, using threads since it can run for some time
         if self.backup_count > 0:
-            schedule.every().day.at(self.backup_time).do(run_threaded, self._backup)
+            timers.daily(self.backup_time, lambda: run_threaded(self._backup), 'backup')
 
-    def dump(self):
-        '''provide a gzipped dump of database'''
-        dump_local.zipped = bytearray()
-        if self.rrdtool:
-            self.write_updates()
-            print('Dump requested')
-            if not db_lock.acquire(blocking=True, timeout=60):
-                print('Error: Dumping failed, could not acquire db lock within 60s')
-                return dump_local.zipped
-            dump_local.start = time.time()
-            dump = subprocess.check_output([self.rrdtool, 'dump', str(self.db_file)])
+    def _snapshot(self, timeout):
+        '''Copy the database to a temporary file while holding the db lock
+        returns (snapshot file name, seconds the lock was held, write generation
+        of the snapshot), the file name is None if the lock was not acquired or
+        the rrdcached daemon could not be flushed'''
+        if not db_lock.acquire(blocking=True, timeout=timeout):
+            return None, 0, None
+        start = time.time()
+        try:
+            generation = self.generation
+            if self.daemon:
+                try:
+                    rrdtool.flushcached(*self.daemon_args, str(self.db_file))
+                except rrdtool.OperationalError as rrd_error:
+                    print("RRDTool daemon flush error, snapshot abandoned:")
+                    print(rrd_error)
+                    return None, time.time() - start, None
+            handle, snapshot = mkstemp(dir=self.db_file.parent,
+                    prefix=f'.{self.db_file.name}.', suffix='.snapshot')
+            os.close(handle)
+            clone_file(self.db_file, snapshot)
+        finally:
             db_lock.release()
-            print(f'Dump is: {len(dump)} bytes raw and '\
-                    f'took {(time.time() - dump_local.start):.2f}s')
-            dump_local.start = time.time()
-            dump_local.zipped = gzip.compress(dump, compresslevel=6)
-            print(f'Dump compressed to {len(dump_local.zipped)} bytes '\
-                    f'in {(time.time() - dump_local.start):.2f}s')
-        else:
+        return snapshot, time.time() - start, generation
+
+    def dump(self, chunk_size=65536):
+        '''provide a gzipped xml dump of database
+        returns (generator yielding compressed chunks, write generation of the
+        dumped data), or None if unavailable
+
+        The db lock is only held while the database is copied to a snapshot,
+        the snapshot is then dumped and compressed one chunk at a time'''
+        if not self.rrdtool:
             print('Dump requested but denied because commandline "rrdtool" unavailable')
-        return dump_local.zipped
+            return None
+        self.write_updates()
+        print('Dump requested')
+        snapshot, held, generation = self._snapshot(60)
+        if not snapshot:
+            print('Error: Dumping failed, could not acquire db lock within 60s')
+            return None
+        print(f'Dump snapshot took {held:.3f}s')
+        stream = self._dump_stream(snapshot, chunk_size)
+        # Start the generator so that closing it always removes the snapshot
+        next(stream)
+        return stream, generation
+
+    def _dump_stream(self, snapshot, chunk_size):
+        '''Generator, dumps the snapshot and yields gzip compressed chunks'''
+        start = time.time()
+        raw = zipped = 0
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        try:
+            with subprocess.Popen([self.rrdtool, 'dump', snapshot],
+                    stdout=subprocess.PIPE) as dumper:
+                yield b''
+                while True:
+                    chunk = dumper.stdout.read(chunk_size)
+                    if not chunk:
+                        break
+                    raw += len(chunk)
+                    block = compressor.compress(chunk)
+                    zipped += len(block)
+                    yield block
+            if dumper.returncode != 0:
+                raise subprocess.CalledProcessError(dumper.returncode, dumper.args)
+            block = compressor.flush()
+            zipped += len(block)
+            yield block
+            print(f'Dump of {raw} bytes raw, compressed to {zipped} bytes '\
+                    f'in {(time.time() - start):.2f}s')
+        finally:
+            os.remove(snapshot)
 
-    def update(self, data):
-        '''Update the database with the latest readings'''
-        dataline = str(int(time.time()))
+    def update(self, data, timestamp=None):
+        '''Update the database with the latest readings, taken at (timestamp)
+        if given, otherwise now
+        returns (seconds caching, seconds writing the cache or None if not written)'''
+        start = time.monotonic()
+        timestamp = int(timestamp or time.time())
+        if self.daemon and self._update_daemon(data, timestamp):
+            return time.monotonic() - start, None
+        dataline = str(timestamp)
         for source in self.sources:
             dataline += f':{data[source]}'
-        self.cache.append(dataline)
+        with cache_lock:
+            self.cache.append(dataline)
+            if self.journal:
+                self.journal.append(dataline)
+        cached = time.monotonic()
         if time.time() > (self.last_write + self.cache_age)\
                 and not db_lock.locked():
             self.write_updates()
+            return cached - start, time.monotonic() - cached
+        return cached - start, None
+
+    def _update_daemon(self, data, timestamp):
+        '''Send the latest readings to the rrdcached daemon, which batches
+        and journals them itself. Returns False if the update failed'''
+        dataline = str(timestamp)
+        for source in self.ds_order:
+            dataline += f':{data[source]}' if source in self.sources else ':U'
+        try:
+            rrdtool.update(str(self.db_file), *self.daemon_args, dataline)
+        except rrdtool.OperationalError as rrd_error:
+            print("RRDTool daemon update error, caching locally:")
+            print(rrd_error)
+            return False
+        self.generation += 1
+        self.generation_time = time.time()
+        return True
 
     def write_updates(self):
         '''write any cached updates to the database'''
         if len(self.cache) > 0:
-            if not db_lock.acquire(blocking=True, timeout=self.cache_age):
+            with timed('lock'):
+                acquired = db_lock.acquire(blocking=True, timeout=self.cache_age)
+            if not acquired:
                 print('Error: Data Write failed, could not acquire database '\
                         f'lock within write period ({self.cache_age}s)')
                 return
             # check if cache was emptied in another thread while waiting for lock
-            if len(self.cache) > 0:
-                # print(f'DB WRITE:len={len(self.cache)}')
+            with cache_lock:
+                pending = list(self.cache)
+            if len(pending) > 0:
+                # print(f'DB WRITE:len={len(pending)}')
                 try:
-                    rrdtool.update(
-                            str(self.db_file),
-                            "--template", self.template,
-                            "--skip-past-updates",
-                            *self.cache)
-                    self.cache = []
+                    with timed('flush'):
+                        rrdtool.update(
+                                str(self.db_file),
+                                "--template", self.template,
+                                "--skip-past-updates",
+                                *pending)
+                    with cache_lock:
+                        # Keep anything added while we were writing
+                        del self.cache[:len(pending)]
+                        if self.journal:
+                            self.journal.reset(self.template, self.cache)
+                    self.generation += 1
+                    self.generation_time = time.time()
                 except rrdtool.OperationalError as rrd_error:
                     print("RRDTool update error:")
                     print(rrd_error)
             db_lock.release()
         self.last_write = time.time()
 
-    def draw_graph(self, start, end, duration, graph):
-        '''Generate a graph, returns a raw png image'''
+    def series(self, source, start, end, points, run=None):
+        '''Fetch a time series for a source, downsampled to at most (points)
+        returns the series as json (bytes), or empty if unavailable
+
+        Results are cached in the same way as graphs. The cache is checked
+        here, only a fetch is passed to run(func, *args) (eg a render pool),
+        if run() returns None (busy) so does this'''
+        if source not in self.sources:
+            print(f'Error: No series available for source: {source}')
+            return bytearray()
+        self.write_updates()
+        window = self._window(start, end)
+        if window:
+            (start, end, _) = window
+        key = ('series', source, start, end, points, self.generation)
+        if window and self.graph_cache:
+            response = self.graph_cache.get(key)
+            if response is not None:
+                return response
+        response = (run or _direct)(self._series, source, start, end, points)
+        if response and window and self.graph_cache:
+            self.graph_cache.put(key, response)
+        return response
+
+    def _series(self, source, start, end, points):
+        '''Fetch and downsample a series, returns json (bytes) or empty'''
+        try:
+            with timed('render'):
+                # A cheap fetch from the coarsest archive resolves the window so that
+                #  the main fetch can use the coarsest archive giving enough points
+                ((first, last, _), _, _) = rrdtool.fetch(str(self.db_file), 'AVERAGE',
+                        *self.daemon_args, '--start', start, '--end', end,
+                        '--resolution', str(self.rra_steps[-1]))
+                resolution = self.rra_steps[0]
+                for step in self.rra_steps:
+                    if step <= (last - first) / points:
+                        resolution = step
+                ((first, last, step), names, rows) = rrdtool.fetch(str(self.db_file),
+                        'AVERAGE', *self.daemon_args, '--start', start, '--end', end,
+                        '--resolution', str(resolution))
+        except rrdtool.OperationalError as fetch_error:
+            print(f'Series fetch failed:\n{fetch_error}')
+            return bytearray()
+        column = names.index(source)
+        values = [row[column] for row in rows]
+        return json.dumps({
+                'source': source,
+                'start': first,
+                'end': last,
+                'step': step,
+                'points': downsample(first, step, values, points),
+                }, separators=(',', ':')).encode('utf-8')
+
+    def draw_graph(self, start, end, duration, graph, run=None):
+        '''Generate a graph, returns a raw png image
+
+        Images are served from the graph cache while the resolved time window
+        and database write generation are unchanged. The cache is checked
+        here, only a render is passed to run(func, *args) (eg a render pool),
+        if run() returns None (busy) so does this'''
         graph_local.response = bytearray()
         if (graph in self.sources) and (graph in self.graph_map.keys()):
             self.write_updates()
-            params = self.graph_map[graph]
-            timestamp = time.strftime(self.graph_args['time_format'])
-            duration = duration.replace('now',
-                    f'{time.strftime(self.graph_args["time_stamp"])}')
-            rrd_args = ["--full-size-mode",
-                        "--start", start,
-                        "--end", end,
-                        "--watermark",
-                        f'{self.graph_args["name"]} :: {graph} :: {timestamp}',
-                        "--width", str(self.graph_args["wide"])
-                        ]
-            if graph.split('-')[0] in self.half_height:
-                rrd_args.extend(["--height", str(self.graph_args["high"]/2)])
+            window = self._window(start, end)
+            if window and self.graph_cache:
+                key = (graph, *window, duration, self.graph_args["wide"],
+                        self.graph_args["high"], self.generation)
+                graph_local.response = self.graph_cache.get(key)
+                if graph_local.response is None:
+                    graph_local.response = (run or _direct)(self._graph,
+                            graph, *window, duration)
+                    if graph_local.response is None:
+                        return None
+                    self.graph_cache.put(key, graph_local.response)
             else:
-                rrd_args.extend(["--height", str(self.graph_args["high"])])
-            rrd_args.extend(["--title", f'{params[0]}: {duration}'])
-            if params[1]:
-                rrd_args.extend(["--upper-limit", params[1]])
-            if params[2]:
-                rrd_args.extend(["--lower-limit", params[2]])
-            rrd_args.extend(["--left-axis-format", params[3]])
-            if len(params) > 5:
-                rrd_args.extend(params[5:])
-            rrd_args.extend([f'DEF:data={str(self.db_file)}:{graph}:AVERAGE'])
-            if self.graph_args["area_color"]:
-                rrd_args.extend([f'AREA:data{self.graph_args["area_color"]}:'\
-                        f'gradheight={self.graph_args["area_depth"]}'])
-            rrd_args.extend([f'LINE{self.graph_args["line_width"]}:'\
-                    f'data{self.graph_args["line_color"]}:'\
-                    f'{self.graph_args["name"]}',
-                    rf'GPRINT:data:MIN:Min\:{params[4]}',
-                    rf'GPRINT:data:AVERAGE:Average\:{params[4]}',
-                    rf'GPRINT:data:MAX:Max\:{params[4]}',
-                    rf'GPRINT:data:LAST:Last\:{params[4]}'])
-            rrd_args.extend(['COMMENT: ', 'COMMENT: '])
-
-            try:
-                graph_local.response = subprocess.check_output(
-                        [self.rrdtool, 'graph', '-', *rrd_args])
-            except subprocess.CalledProcessError as graph_error:
-                print(f'Graph generation failed:\n{graph_error}')
-                print(f'cmd: {graph_error.cmd}')
-                print(f'output: {graph_error.output}')
-                print(f'stdout: {graph_error.stderr}')
-
+                graph_local.response = (run or _direct)(self._graph, graph,
+                        *(window or (start, end, time.time())), duration)
+                if graph_local.response is None:
+                    return None
             if len(graph_local.response) == 0:
                 print(f'Error: png file generation failed for : {graph} : {start}>>{end}')
         else:
             print(f'Error: No graph available for type: {graph}')
         return graph_local.response
 
+    def draw_overview(self, start, end, duration, run=None):
+        '''Generate a single overview graph of all active sources, returns a raw png
+
+        Cached, and rendered via run(), in the same way as individual graphs'''
+        graph_local.response = bytearray()
+        self.write_updates()
+        window = self._window(start, end)
+        if window and self.graph_cache:
+            key = ('overview', *window, duration, self.graph_args["wide"],
+                    self.graph_args["high"], self.generation)
+            graph_local.response = self.graph_cache.get(key)
+            if graph_local.response is None:
+                graph_local.response = (run or _direct)(self._overview, *window, duration)
+                if graph_local.response is None:
+                    return None
+                self.graph_cache.put(key, graph_local.response)
+        else:
+            graph_local.response = (run or _direct)(self._overview,
+                    *(window or (start, end, time.time())), duration)
+            if graph_local.response is None:
+                return None
+        if len(graph_local.response) == 0:
+            print(f'Error: overview png generation failed for : {start}>>{end}')
+        return graph_local.response
+
+    def graph_sources(self):
+        '''The sources listed on the graphs page, stage timings only if enabled'''
+        return [graph for graph in self.graph_map.keys() if graph in self.sources
+                and (self.graph_timings or not graph.startswith('time-'))]
+
+    def overview_sources(self):
+        '''The sources shown on the overview graph, top to bottom'''
+        return self.graph_sources()
+
+    def _overview(self, start, end, stamp, duration):
+        '''Build the overview graph arguments and render, returns a raw png
+
+        Every source is drawn in its own horizontal band, scaled between its
+        minimum and maximum for the window. All the DEFs use the same file,
+        consolidation function and window, so rrdtool reads the data once'''
+        sources = self.overview_sources()
+        band = max(1, self.graph_args["high"] // 3)
+        timestamp = time.strftime(self.graph_args['time_format'], time.localtime(stamp))
+        duration = duration.replace('now',
+                f'{time.strftime(self.graph_args["time_stamp"], time.localtime(stamp))}')
+        rrd_args = [*self.daemon_args,
+                    "--start", start,
+                    "--end", end,
+                    "--watermark",
+                    f'{self.graph_args["name"]} :: overview :: {timestamp}',
+                    "--width", str(self.graph_args["wide"]),
+                    "--height", str(band * len(sources)),
+                    "--title", f'{self.graph_args["name"]} Overview: {duration}',
+                    "--lower-limit", "0",
+                    "--upper-limit", str(len(sources)),
+                    "--rigid",
+                    "--y-grid", "none"]
+        for index, graph in enumerate(sources):
+            params = self.graph_map[graph]
+            offset = len(sources) - index - 1
+            color = OVERVIEW_COLORS[index % len(OVERVIEW_COLORS)]
+            label = params[0].split(',')[0].replace(':', r'\:')
+            rrd_args.extend([f'DEF:d{index}={str(self.db_file)}:{graph}:AVERAGE',
+                    f'VDEF:lo{index}=d{index},MINIMUM',
+                    f'VDEF:hi{index}=d{index},MAXIMUM',
+                    f'CDEF:b{index}=d{index},lo{index},-,hi{index},lo{index},-,'\
+                            f'0.000001,MAX,/,0.8,*,0.1,+,{offset},+',
+                    f'HRULE:{offset}#E0E0E0',
+                    f'LINE{self.graph_args["line_width"]}:b{index}{color}:{label}',
+                    rf'GPRINT:d{index}:MIN:Min\:{params[4]}',
+                    rf'GPRINT:d{index}:MAX:Max\:{params[4]}',
+                    rf'GPRINT:d{index}:LAST:Last\:{params[4]}\l'])
+        return self._render(rrd_args)
+
+    def _window(self, start, end):
+        '''Resolve a graph time window into a repeatable (start, end, stamp)
+        returns None if the window is not repeatable (and cannot be cached)
+
+        Windows ending 'now' are pinned to the latest step boundary so that all
+        requests within a step are identical, relative starts such as
+        'end-1d' or 'now-1d' then follow the pinned end'''
+        if end in ('now', ''):
+            stamp = int(time.time()) // self.step * self.step
+            return (start.replace('now', 'end'), str(stamp), stamp)
+        if end.isdigit() and 'now' not in start:
+            return (start, end, self.generation_time)
+        return None
+
+    def _graph(self, graph, start, end, stamp, duration):
+        '''Build the graph arguments and render, returns a raw png image
+        stamp is the time shown in the watermark and title'''
+        params = self.graph_map[graph]
+        timestamp = time.strftime(self.graph_args['time_format'], time.localtime(stamp))
+        duration = duration.replace('now',
+                f'{time.strftime(self.graph_args["time_stamp"], time.localtime(stamp))}')
+        rrd_args = [*self.daemon_args,
+                    "--full-size-mode",
+                    "--start", start,
+                    "--end", end,
+                    "--watermark",
+                    f'{self.graph_args["name"]} :: {graph} :: {timestamp}',
+                    "--width", str(self.graph_args["wide"])
+                    ]
+        if graph.split('-')[0] in self.half_height:
+            rrd_args.extend(["--height", str(self.graph_args["high"]/2)])
+        else:
+            rrd_args.extend(["--height", str(self.graph_args["high"])])
+        rrd_args.extend(["--title", f'{params[0]}: {duration}'])
+        if params[1]:
+            rrd_args.extend(["--upper-limit", params[1]])
+        if params[2]:
+            rrd_args.extend(["--lower-limit", params[2]])
+        rrd_args.extend(["--left-axis-format", params[3]])
+        if len(params) > 5:
+            rrd_args.extend(params[5:])
+        rrd_args.extend([f'DEF:data={str(self.db_file)}:{graph}:AVERAGE'])
+        if self.graph_args["area_color"]:
+            rrd_args.extend([f'AREA:data{self.graph_args["area_color"]}:'\
+                    f'gradheight={self.graph_args["area_depth"]}'])
+        rrd_args.extend([f'LINE{self.graph_args["line_width"]}:'\
+                f'data{self.graph_args["line_color"]}:'\
+                f'{self.graph_args["name"]}',
+                rf'GPRINT:data:MIN:Min\:{params[4]}',
+                rf'GPRINT:data:AVERAGE:Average\:{params[4]}',
+                rf'GPRINT:data:MAX:Max\:{params[4]}',
+                rf'GPRINT:data:LAST:Last\:{params[4]}'])
+        rrd_args.extend(['COMMENT: ', 'COMMENT: '])
+        return self._render(rrd_args)
+
+    def _render(self, rrd_args):
+        '''Render a png from the graph arguments, returns the raw image
+
+        Uses the in-process bindings (no fork) when enabled, falling back to
+        the commandline rrdtool if the bindings fail or are unavailable'''
+        with timed('render'):
+            if self.in_process:
+                try:
+                    return rrdtool.graphv('-', *rrd_args)['image']
+                except (rrdtool.OperationalError, KeyError) as graph_error:
+                    print(f'In-process graph generation failed:\n{graph_error}')
+            if self.rrdtool:
+                try:
+                    return subprocess.check_output([self.rrdtool, 'graph', '-', *rrd_args])
+                except subprocess.CalledProcessError as graph_error:
+                    print(f'Graph generation failed:\n{graph_error}')
+                    print(f'cmd: {graph_error.cmd}')
+                    print(f'output: {graph_error.output}')
+                    print(f'stdout: {graph_error.stderr}')
+            return bytearray()
+
+def _direct(func, *args):
+    '''Run func(*args) in the calling thread'''
+    return func(*args)
+
+def clone_file(source, dest):
+    '''Copy a file as cheaply as possible; a copy-on-write reflink where the
+    filesystem supports it, an in-kernel copy_file_range() or a plain copy
+    '''
+    with open(source, 'rb') as src, open(dest, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return
+        except OSError:
+            pass
+        if hasattr(os, 'copy_file_range'):
+            try:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    return
+            except OSError:
+                pass
+        src.seek(0)
+        dst.seek(0)
+        dst.truncate()
+        copyfileobj(src, dst, 1048576)
+
 def run_threaded(job_func):
     '''Start a job in a new thread
     '''
@@ -0,0 +1,88 @@
+'''Downsampling of fetched RRD time series for the SBCEye project
+
+provides:
+    downsample(start, step, values, points): reduce a series to at most
+        (points) [time, value] pairs using min/max bucketing
+
+Uses numpy (if available) to bucket the values in a vectorised manner,
+otherwise falls back to an equivalent pure python implementation.
+'''
+
+from math import ceil, isnan
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def downsample(start, step, values, points):
+    '''Reduce a series to at most (points) [time, value] pairs
+
+    The series is split into points/2 buckets and the minimum and maximum
+    of each bucket are kept (in time order), so that peaks and troughs are
+    preserved. Buckets with no valid values give a single null point to
+    preserve gaps in the data.
+
+    parameters:
+        start: (int) series start time, as returned from rrdtool.fetch()
+        step: (int) time between values, seconds
+        values: (list) of float or None values
+        points: (int) maximum number of points to return
+
+    returns:
+        list of [time, value] pairs, value is None where unknown
+    '''
+    count = len(values)
+    if count <= points:
+        return [[start + step * (i + 1), _valid(value)] for i, value in enumerate(values)]
+    width = ceil(count / max(1, points // 2))
+    # Only as many buckets as the width needs, so none lie beyond the data
+    buckets = ceil(count / width)
+    if numpy:
+        pairs = _bucket_numpy(values, buckets, width)
+    else:
+        pairs = _bucket_python(values, buckets, width)
+    series = []
+    for bucket, (first, second) in enumerate(pairs):
+        if first is None:
+            series.append([start + step * (bucket * width + 1), None])
+            continue
+        series.append([start + step * (first + 1), values[first]])
+        if second != first:
+            series.append([start + step * (second + 1), values[second]])
+    return series
+
+def _valid(value):
+    '''Return None for unknown values'''
+    if value is None or isnan(value):
+        return None
+    return value
+
+def _bucket_numpy(values, buckets, width):
+    '''Vectorised min/max bucketing, returns [(first, second)] row indexes
+    per bucket, in time order, or (None, None) for empty buckets'''
+    grid = numpy.full(buckets * width, numpy.nan)
+    grid[:len(values)] = numpy.array(values, dtype=float)
+    grid = grid.reshape(buckets, width)
+    valid = ~numpy.isnan(grid)
+    lows = numpy.where(valid, grid, numpy.inf).argmin(axis=1)
+    highs = numpy.where(valid, grid, -numpy.inf).argmax(axis=1)
+    offsets = numpy.arange(buckets) * width
+    firsts = (numpy.minimum(lows, highs) + offsets).tolist()
+    seconds = (numpy.maximum(lows, highs) + offsets).tolist()
+    return [(first, second) if has else (None, None)
+            for first, second, has in zip(firsts, seconds, valid.any(axis=1).tolist())]
+
+def _bucket_python(values, buckets, width):
+    '''Pure python min/max bucketing, same returns as _bucket_numpy()'''
+    pairs = []
+    for bucket in range(buckets):
+        indexes = [i for i in range(bucket * width, min((bucket + 1) * width, len(values)))
+                if _valid(values[i]) is not None]
+        if not indexes:
+            pairs.append((None, None))
+            continue
+        low = min(indexes, key=lambda i: values[i])
+        high = max(indexes, key=lambda i: values[i])
+        pairs.append((min(low, high), max(low, high)))
+    return pairs
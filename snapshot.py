@@ -0,0 +1,89 @@
+'''Shared-memory snapshot of the readings, for the display process
+
+provides:
+    DataSnapshot: a fixed layout block of shared memory with a slot per key,
+        written once per update and read by another process without pickling
+'''
+
+from ctypes import c_double, c_uint64
+from math import isnan
+from multiprocessing import Event, Lock
+from multiprocessing.sharedctypes import RawArray, RawValue
+from time import sleep
+
+class DataSnapshot:
+    '''One float64 slot per known key in shared memory, guarded by a lock
+    and a write sequence counter so that readers always see a consistent
+    snapshot
+
+    The writer updates the slots and the counter with the lock held, a reader
+    copies them with the lock held, only trying to take it so the writer is
+    never waited for; the lock, unlike plain shared memory, is a memory
+    barrier between the processes, so a snapshot cannot be torn even on
+    weakly ordered CPUs (eg ARM). The counter is the fast path: a reader that
+    finds it unchanged since its last copy reuses that copy without locking,
+    at worst this is one write out of date. Missing and unknown ('U')
+    readings are held as NaN. A single event is set per write so that readers
+    can wait for new data. Create it before starting the reading process, and
+    pass it to that process as an argument.
+
+    parameters:
+        keys: (list) the keys held, in slot order
+
+    provides:
+        write(data): copy the known keys from data{} into the slots
+        read(): returns a dict of the keys that have values, None if no
+            consistent snapshot could be read
+        wait(timeout): wait for a write, returns True if there was one
+    '''
+
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self.values = RawArray(c_double, len(self.keys))
+        self.sequence = RawValue(c_uint64, 0)
+        self.lock = Lock()
+        self.updated = Event()
+        self.last = (None, None)  # (sequence, readings) of this process' last read
+        for slot in range(len(self.keys)):
+            self.values[slot] = float('nan')
+
+    def write(self, data):
+        '''Write the current values, there must only be one writer'''
+        values = [_slot_value(data.get(key)) for key in self.keys]
+        with self.lock:
+            self.values[:] = values
+            self.sequence.value += 1
+        self.updated.set()
+
+    def read(self, retries=100):
+        '''Copy a consistent snapshot of the slots'''
+        (sequence, readings) = self.last
+        if sequence == self.sequence.value:
+            return dict(readings)
+        for _ in range(retries):
+            if self.lock.acquire(block=False):
+                try:
+                    sequence = self.sequence.value
+                    values = self.values[:]
+                finally:
+                    self.lock.release()
+                readings = {key: value for key, value in zip(self.keys, values)
+                        if not isnan(value)}
+                self.last = (sequence, readings)
+                return dict(readings)
+            sleep(0.001)
+        return None
+
+    def wait(self, timeout):
+        '''Wait up to (timeout) seconds for new data'''
+        if self.updated.wait(timeout):
+            self.updated.clear()
+            return True
+        return False
+
+def _slot_value(value):
+    '''Slot value for a reading, NaN if missing or unknown'''
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
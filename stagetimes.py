@@ -0,0 +1,72 @@
+'''Collection cycle timing for the SBCEye project
+
+provides:
+    StageTimes: rolling timings of each stage of data collection, published
+        into data{} as internal readings so that they are recorded and graphed
+'''
+
+from collections import deque
+from math import ceil
+from threading import Lock
+
+# Statistics published for each stage
+STATS = ('p50', 'p95', 'max')
+# Timings kept for each stage when not otherwise configured
+WINDOW = 60
+
+def _percentile(times, fraction):
+    '''Nearest rank percentile of a sorted list'''
+    return times[max(0, min(len(times), ceil(fraction * len(times))) - 1)]
+
+class StageTimes:
+    '''Keep the recent durations of each stage, and their statistics
+
+    Stages are timed by their callers with a monotonic clock and recorded
+    here. The median, 95th percentile and maximum over the last (window)
+    timings of each stage are published into data{} as 'time-<stage>-<stat>'
+    readings, in milliseconds, or 'U' for stages that have not run yet.
+
+    parameters:
+        stages: (list) the stage names, these are fixed when created
+        window: (int) number of recent timings the statistics are taken
+            over, 0 for the default (WINDOW)
+        recorded: (bool) publish the statistics into data{}, if False
+            publish() does nothing and they are only available via stats()
+
+    provides:
+        record(stage, seconds): record a timing
+        latest: (dict) stage: seconds, the latest timing of each stage
+        stats(stage): returns a dict of the statistics for a stage, or None
+        publish(data): write the statistics into data{}
+    '''
+
+    def __init__(self, stages, window, recorded=True):
+        self.recorded = recorded
+        self.times = {stage: deque(maxlen=window or WINDOW) for stage in stages}
+        self.latest = {}
+        self.lock = Lock()
+
+    def record(self, stage, seconds):
+        '''Record a timing for a stage'''
+        with self.lock:
+            self.latest[stage] = seconds
+            if stage in self.times:
+                self.times[stage].append(seconds)
+
+    def stats(self, stage):
+        '''The statistics for a stage, None if it has no timings'''
+        with self.lock:
+            times = sorted(self.times[stage])
+        if not times:
+            return None
+        return {'p50': _percentile(times, 0.5), 'p95': _percentile(times, 0.95),
+                'max': times[-1]}
+
+    def publish(self, data):
+        '''Write the statistics of every stage into data{}, in milliseconds'''
+        if not self.recorded:
+            return
+        for stage in self.times:
+            stats = self.stats(stage)
+            for stat in STATS:
+                data[f'time-{stage}-{stat}'] = round(stats[stat] * 1000, 3) if stats else 'U'
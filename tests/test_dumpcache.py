@@ -0,0 +1,89 @@
+'''Tests for the shared, background generated database dump'''
+
+import os
+import sys
+import types
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+try:
+    import rrdtool  # pylint: disable=unused-import
+except ImportError:
+    stub = types.ModuleType('rrdtool')
+    stub.OperationalError = type('OperationalError', (Exception,), {})
+    sys.modules['rrdtool'] = stub
+import dumpcache  # pylint: disable=wrong-import-position
+
+class FakeRobin:
+    '''Dumps its generation, once (release) is set'''
+
+    def __init__(self):
+        self.generation = 1
+        self.release = threading.Event()
+        self.fail = False
+        self.dumps = 0
+
+    def dump(self):
+        '''The dump stream and the generation it was made from'''
+        self.release.wait(5)
+        self.dumps += 1
+        if self.fail:
+            return None
+        return ((block for block in [f'dump {self.generation}'.encode()]),
+                self.generation)
+
+class DumpCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.rrd = FakeRobin()
+        self.cache = dumpcache.DumpCache(self.rrd,
+                os.path.join(self.folder.name, 'dump.xml.gz'), 0)
+
+    def _wait(self):
+        '''Let the running dump finish'''
+        self.rrd.release.set()
+        for thread in threading.enumerate():
+            if thread.name == 'sbceye_dump':
+                thread.join(5)
+
+    def test_busy_while_made(self):
+        self.assertEqual(self.cache.get(), dumpcache.BUSY)
+        self.assertEqual(self.cache.get(), dumpcache.BUSY)
+        self._wait()
+        (dumpfile, generation, _) = self.cache.get()
+        with dumpfile:
+            self.assertEqual(dumpfile.read(), b'dump 1')
+        self.assertEqual(generation, 1)
+        self.assertEqual(self.rrd.dumps, 1)
+
+    def test_open_file_survives_replacement(self):
+        self.cache.get()
+        self._wait()
+        (dumpfile, generation, _) = self.cache.get()
+        with dumpfile:
+            # The data changes and a new dump replaces the one being sent
+            self.rrd.generation = 2
+            self.assertEqual(self.cache.get(), dumpcache.BUSY)
+            self._wait()
+            self.assertEqual(dumpfile.read(), b'dump 1')
+        self.assertEqual(generation, 1)
+        (dumpfile, generation, _) = self.cache.get()
+        with dumpfile:
+            self.assertEqual(dumpfile.read(), b'dump 2')
+        self.assertEqual(generation, 2)
+
+    def test_failure_reported_once(self):
+        self.rrd.fail = True
+        self.cache.get()
+        self._wait()
+        self.assertIsNone(self.cache.get())
+        self.assertEqual(self.cache.get(), dumpcache.BUSY)
+        self._wait()
+        self.assertEqual(self.rrd.dumps, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+'''Tests for the update journal'''
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import journal  # pylint: disable=wrong-import-position
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.path = os.path.join(self.folder.name, 'test.journal')
+        self.journal = journal.Journal(self.path, 30)
+        self.addCleanup(self.journal.file.close)
+
+    def _reopen(self):
+        '''Open the journal afresh, as after a restart'''
+        self.journal.file.close()
+        self.journal = journal.Journal(self.path, 30)
+
+    def test_replay_after_restart(self):
+        self.journal.reset('a:b')
+        self.journal.append('100:1:2')
+        self.journal.append('110:3:4')
+        self._reopen()
+        self.assertEqual(self.journal.replay(), [('a:b', ['100:1:2', '110:3:4'])])
+
+    def test_template_changes(self):
+        self.journal.reset('a:b', ['100:1:2'])
+        self.journal.file.write('# a:b:c\n')
+        self.journal.append('110:1:2:3')
+        self.assertEqual(self.journal.replay(),
+                [('a:b', ['100:1:2']), ('a:b:c', ['110:1:2:3'])])
+
+    def test_empty_blocks_and_headerless_lines(self):
+        self._reopen()
+        self.journal.append('90:9:9')  # no template, cannot be replayed
+        self.journal.file.write('# a:b\n# a:b:c\n\n')
+        self.journal.append('100:1:2:3')
+        self.assertEqual(self.journal.replay(), [('a:b:c', ['100:1:2:3'])])
+
+    def test_reset_keeps_lines(self):
+        self.journal.reset('a:b')
+        self.journal.append('100:1:2')
+        self.journal.append('110:3:4')
+        self.journal.reset('a:b', ['110:3:4'])
+        self._reopen()
+        self.assertEqual(self.journal.replay(), [('a:b', ['110:3:4'])])
+        with open(self.path, encoding='ascii') as journal_file:
+            self.assertEqual(journal_file.read(), '# a:b\n110:3:4\n')
+
+    def test_sync_interval(self):
+        with mock.patch.object(journal.os, 'fsync') as fsync:
+            self.journal.reset('a:b')
+            self.assertEqual(fsync.call_count, 1)
+            self.journal.append('100:1:2')
+            self.assertEqual(fsync.call_count, 1)
+            self.journal.last_sync -= 31
+            self.journal.append('110:3:4')
+            self.assertEqual(fsync.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
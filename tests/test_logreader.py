@@ -0,0 +1,115 @@
+'''Tests for the log tail and the log index'''
+
+import os
+import sys
+import time
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import logreader  # pylint: disable=wrong-import-position
+
+FORMAT = '%d-%m-%Y %H:%M:%S'
+START = time.mktime((2024, 1, 1, 12, 0, 0, 0, 0, -1))
+
+def entry(number, level='INFO'):
+    '''A log entry, one second apart'''
+    return f'{time.strftime(FORMAT, time.localtime(START + number))} {level}: entry {number}\n'
+
+class LogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.log_file = os.path.join(self.folder.name, 'test.log')
+
+    def _write(self, lines, suffix=''):
+        with open(self.log_file + suffix, 'w', encoding='utf-8') as log:
+            log.writelines(lines)
+
+class TailTest(LogTest):
+
+    def test_tail_within_file(self):
+        self._write([f'line {n}\n' for n in range(10)])
+        self.assertEqual(''.join(logreader.tail(self.log_file, 3)), 'line 7\nline 8\nline 9\n')
+
+    def test_tail_across_blocks_and_rotation(self):
+        # Small read blocks, and the tail starting in the rotated file
+        self._write([f'old {n}\n' for n in range(5)], '.1')
+        self._write([f'line {n}\n' for n in range(5)])
+        with mock.patch.object(logreader, 'READ_BLOCK', 7):
+            text = ''.join(logreader.tail(self.log_file, 7))
+        self.assertEqual(text.splitlines(), ['old 3', 'old 4'] + [f'line {n}' for n in range(5)])
+
+    def test_tail_more_than_logged(self):
+        self._write(['one\n', 'two\n'])
+        self.assertEqual(''.join(logreader.tail(self.log_file, 10)), 'one\ntwo\n')
+
+    def test_no_logs(self):
+        self.assertEqual(list(logreader.tail(self.log_file, 10)), [])
+
+class IndexTest(LogTest):
+
+    def setUp(self):
+        super().setUp()
+        self.index = logreader.LogIndex(self.log_file, FORMAT)
+        bucket = mock.patch.object(logreader, 'BUCKET_LINES', 4)
+        bucket.start()
+        self.addCleanup(bucket.stop)
+
+    def test_buckets(self):
+        self._write([entry(n) for n in range(10)])
+        ((_, buckets),) = self.index.refresh()
+        self.assertEqual([bucket['lines'] for bucket in buckets], [4, 4, 2])
+        self.assertEqual(buckets[1]['first'], START + 4)
+        self.assertEqual(buckets[1]['last'], START + 7)
+        self.assertEqual(buckets[-1]['end'], os.path.getsize(self.log_file))
+
+    def test_incremental(self):
+        self._write([entry(n) for n in range(6)])
+        self.index.refresh()
+        with open(self.log_file, 'a', encoding='utf-8') as log:
+            log.write(entry(6) + 'partial')
+        ((_, buckets),) = self.index.refresh()
+        # The part filled bucket is topped up, the unfinished line is left
+        self.assertEqual([bucket['lines'] for bucket in buckets], [4, 3])
+
+    def test_time_and_level(self):
+        self._write([entry(n, 'WARNING' if n % 3 == 0 else 'INFO') for n in range(12)])
+        lines = self.index.query(since=START + 2, until=START + 9, level='WARNING')
+        self.assertEqual(lines, [entry(3, 'WARNING'), entry(6, 'WARNING'), entry(9, 'WARNING')])
+
+    def test_limit_keeps_latest(self):
+        self._write([entry(n) for n in range(10)])
+        self.assertEqual(self.index.query(limit=2), [entry(8), entry(9)])
+
+    def test_continuation_across_buckets(self):
+        # A traceback of the error entry runs on into the next bucket
+        traceback = [f'  trace {n}\n' for n in range(5)]
+        self._write([entry(0), entry(1), entry(2, 'ERROR')] + traceback + [entry(3)])
+        self.assertEqual(self.index.query(level='ERROR'), [entry(2, 'ERROR')] + traceback)
+
+    def test_continuation_at_top_of_file(self):
+        self._write(['  trace a\n', '  trace b\n', entry(0), '  trace c\n'])
+        self.assertEqual(self.index.query(grep='TRACE'),
+                ['  trace a\n', '  trace b\n', '  trace c\n'])
+        # With an entry filter the lines of an unknown entry are left out
+        self.assertEqual(self.index.query(level='INFO'), [entry(0), '  trace c\n'])
+
+    def test_grep_after_skipped_bucket(self):
+        # A skipped bucket ends any entry carried over from before it
+        self._write([entry(0, 'ERROR'), '  trace\n'] + [entry(n) for n in range(1, 7)]
+                + ['  more trace\n', entry(7, 'ERROR')])
+        self.assertEqual(self.index.query(level='ERROR', grep='trace'), ['  trace\n'])
+
+class ParseWhenTest(unittest.TestCase):
+
+    def test_forms(self):
+        self.assertEqual(logreader.parse_when('1700000000'), 1700000000.0)
+        self.assertAlmostEqual(logreader.parse_when('2h'), time.time() - 7200, delta=5)
+        self.assertEqual(logreader.parse_when('2024-01-01T12:00:00'), START)
+        self.assertIsNone(logreader.parse_when('soon'))
+
+if __name__ == '__main__':
+    unittest.main()
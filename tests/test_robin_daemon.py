@@ -0,0 +1,104 @@
+'''Tests for Robin's rrdcached (daemon) mode, against a stub rrdtool'''
+
+import os
+import sys
+import types
+import tempfile
+import unittest
+from unittest import mock
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+try:
+    import rrdtool
+except ImportError:
+    # The bindings are not needed, every call the tests make is patched
+    rrdtool = types.ModuleType('rrdtool')
+    rrdtool.OperationalError = type('OperationalError', (Exception,), {})
+    for name in ('info', 'update', 'flushcached', 'tune', 'create'):
+        setattr(rrdtool, name, None)
+    sys.modules['rrdtool'] = rrdtool
+import robin  # pylint: disable=wrong-import-position
+
+DAEMON = 'unix:/run/rrdcached.sock'
+
+class DaemonTest(unittest.TestCase):
+    '''Robin with 'daemon' set, the database has 'sys-mem' before 'sys-load'
+    and an 'env-temp' source that is no longer reported'''
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        with open(os.path.join(self.folder.name, 'test.rrd'), 'wb') as dbfile:
+            dbfile.write(b'rrd')
+        self.calls = []
+        info = {'step': 10, 'rra[0].pdp_per_row': 1,
+                'ds[env-temp].index': 0, 'ds[sys-mem].index': 1, 'ds[sys-load].index': 2}
+        for name, func in {
+                'info': lambda *args: info,
+                'update': lambda *args: self.calls.append(('update', args)),
+                'flushcached': lambda *args: self.calls.append(('flushcached', args)),
+                'tune': lambda *args: self.calls.append(('tune', args)),
+                }.items():
+            patcher = mock.patch.object(robin.rrdtool, name, func, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(robin, 'which', lambda name: None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        settings = SimpleNamespace(name='test', long_format='%c', short_format='%c',
+                graph_wide=100, graph_high=50, graph_line_color='#000000',
+                graph_line_width=1, graph_area_color='', graph_area_depth=0,
+                graph_half_height=[], graph_in_process=False, graph_timings=False,
+                graph_cache_size=0, graph_workers=1, graph_queue=1,
+                web_sensor_name='', net_map={}, pin_map={}, pin_state_names=('off', 'on'),
+                rrd_dir=self.folder.name, rrd_file_name='test.rrd', rrd_backup_count=0,
+                rrd_backup_age=0, rrd_backup_time='03:00', rrd_backup_nice=False,
+                rrd_journal=True, rrd_journal_sync=0, rrd_daemon=DAEMON,
+                rrd_dump_stale=0, rrd_interval=300)
+        self.data = {'sys-load': 0.5, 'sys-mem': 40.0, 'sys-temp': 50.0}
+        self.rrd = robin.Robin(settings, self.data)
+        self.db_file = os.path.join(self.folder.name, 'test.rrd')
+
+    def test_daemon_arguments(self):
+        self.assertEqual(self.rrd.daemon_args, ['--daemon', DAEMON])
+        self.assertIsNone(self.rrd.journal)
+
+    def test_update_order(self):
+        # Existing sources in database order, then the newly added one
+        self.assertEqual(self.rrd.ds_order, ['env-temp', 'sys-mem', 'sys-load', 'sys-temp'])
+        self.calls.clear()
+        self.assertIsNone(self.rrd.update(self.data, 1000)[1])
+        self.assertEqual(self.calls, [('update',
+                (self.db_file, '--daemon', DAEMON, '1000:U:40.0:0.5:50.0'))])
+        self.assertEqual(self.rrd.cache, [])
+        self.assertEqual(self.rrd.generation, 1)
+
+    def test_update_failure_caches_locally(self):
+        def refuse(*_):
+            raise robin.rrdtool.OperationalError('daemon gone')
+        with mock.patch.object(robin.rrdtool, 'update', refuse):
+            self.rrd.update(self.data, 1000)
+        self.assertEqual(len(self.rrd.cache), 1)
+
+    def test_flush_before_snapshot(self):
+        def clone(source, dest):
+            self.calls.append(('clone', (str(source), dest)))
+        self.calls.clear()
+        with mock.patch.object(robin, 'clone_file', clone):
+            (snapshot, _, generation) = self.rrd._snapshot(1)  # pylint: disable=protected-access
+        os.remove(snapshot)
+        self.assertEqual([call for call, _ in self.calls], ['flushcached', 'clone'])
+        self.assertEqual(self.calls[0][1], ('--daemon', DAEMON, self.db_file))
+        self.assertEqual(generation, 0)
+
+    def test_flush_failure_abandons_snapshot(self):
+        def refuse(*_):
+            raise robin.rrdtool.OperationalError('daemon gone')
+        with mock.patch.object(robin.rrdtool, 'flushcached', refuse):
+            (snapshot, _, _) = self.rrd._snapshot(1)  # pylint: disable=protected-access
+        self.assertIsNone(snapshot)
+        self.assertFalse(robin.db_lock.locked())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+'''Tests for series.downsample()'''
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import series  # pylint: disable=wrong-import-position
+
+class DownsampleTest(unittest.TestCase):
+    '''downsample(), with numpy and with the pure python fallback'''
+
+    def _both(self, *args):
+        '''Run downsample() both ways, check they agree, return the result'''
+        result = series.downsample(*args)
+        with mock.patch.object(series, 'numpy', None):
+            self.assertEqual(series.downsample(*args), result)
+        return result
+
+    def test_short_series_unchanged(self):
+        result = self._both(100, 10, [1.0, None, 3.0], 10)
+        self.assertEqual(result, [[110, 1.0], [120, None], [130, 3.0]])
+
+    def test_no_empty_tail(self):
+        result = self._both(0, 10, [1.0] * 21, 20)
+        self.assertEqual(len(result), 7)
+        self.assertEqual(result[-1], [190, 1.0])
+        self.assertNotIn(None, [value for _, value in result])
+
+    def test_length_and_last_timestamp(self):
+        values = [float(i % 7) for i in range(1000)]
+        result = self._both(0, 10, values, 100)
+        self.assertLessEqual(len(result), 100)
+        self.assertLessEqual(result[-1][0], 10 * len(values))
+        self.assertGreater(result[-1][0], 10 * (len(values) - 20))
+
+    def test_peaks_kept(self):
+        values = [0.0] * 100
+        values[37] = 50.0
+        values[81] = -50.0
+        result = self._both(0, 1, values, 10)
+        self.assertIn([38, 50.0], result)
+        self.assertIn([82, -50.0], result)
+
+    def test_gap_gives_single_null(self):
+        values = [1.0] * 10 + [None] * 10 + [2.0] * 10
+        result = self._both(0, 1, values, 6)
+        self.assertEqual([value for _, value in result], [1.0, None, 2.0])
+        self.assertEqual(result[1][0], 11)
+
+    def test_points_in_time_order(self):
+        values = [float((i * 37) % 11) for i in range(500)]
+        times = [time for time, _ in self._both(0, 1, values, 50)]
+        self.assertEqual(times, sorted(times))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+'''Tests for the shared-memory readings snapshot'''
+
+import os
+import sys
+import unittest
+from multiprocessing import Process, Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import snapshot  # pylint: disable=wrong-import-position
+
+def _reader(shared, results):
+    '''Read snapshots in another process until the writer is done'''
+    torn = 0
+    while True:
+        readings = shared.read()
+        if readings and len(set(readings.values())) > 1:
+            torn += 1
+        if readings and readings['a'] < 0:
+            break
+    results.put(torn)
+
+class DataSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.shared = snapshot.DataSnapshot(['a', 'b', 'c'])
+
+    def test_unknown_values_left_out(self):
+        self.assertEqual(self.shared.read(), {})
+        self.shared.write({'a': 1, 'b': 'U', 'd': 4})
+        self.assertEqual(self.shared.read(), {'a': 1.0})
+
+    def test_unchanged_reuses_copy(self):
+        self.shared.write({'a': 1})
+        first = self.shared.read()
+        first['a'] = 5  # the caller's copy, not the cached one
+        self.assertEqual(self.shared.read(), {'a': 1.0})
+        self.shared.write({'a': 2})
+        self.assertEqual(self.shared.read(), {'a': 2.0})
+
+    def test_writer_holds_lock(self):
+        self.shared.write({'a': 1})
+        self.shared.write({'a': 2})
+        with self.shared.lock:
+            self.assertIsNone(self.shared.read(retries=2))
+        self.assertEqual(self.shared.read(), {'a': 2.0})
+
+    def test_wait(self):
+        self.assertFalse(self.shared.wait(0))
+        self.shared.write({})
+        self.assertTrue(self.shared.wait(0))
+        self.assertFalse(self.shared.wait(0))
+
+    def test_other_process_never_torn(self):
+        results = Queue()
+        reader = Process(target=_reader, args=(self.shared, results))
+        reader.start()
+        for value in range(20000):
+            self.shared.write(dict.fromkeys('abc', value))
+        self.shared.write(dict.fromkeys('abc', -1))
+        self.assertEqual(results.get(timeout=30), 0)
+        reader.join(5)
+
+if __name__ == '__main__':
+    unittest.main()
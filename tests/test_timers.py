@@ -0,0 +1,96 @@
+'''Tests for the drift-free scheduler'''
+
+import os
+import sys
+import types
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+try:
+    import schedule  # pylint: disable=unused-import
+except ImportError:
+    # Only used by PolledTimers, which is not tested here
+    sys.modules['schedule'] = types.ModuleType('schedule')
+import timers  # pylint: disable=wrong-import-position
+
+class TimersTest(unittest.TestCase):
+    '''Timers against a clock that only moves when told to, in UTC'''
+
+    def setUp(self):
+        self.now = 1000003.0
+        for patcher in (mock.patch.object(timers.time, 'time', lambda: self.now),
+                mock.patch.object(timers, '_local_offset', lambda when: 0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.timers = timers.Timers()
+        self.ran = []
+
+    def _job(self, name):
+        return lambda: self.ran.append((name, self.now))
+
+    def test_aligned(self):
+        job = self.timers.every(10, self._job('a'), 'a', align=True)
+        self.assertEqual(job.due, 1000010)
+        self.assertEqual(self.timers.run_pending(), 7)
+        self.now = 1000010.5
+        self.timers.run_pending()
+        self.assertEqual(self.ran, [('a', 1000010.5)])
+        self.assertEqual(job.late, 0.5)
+        # The next run follows the due time, not the late start
+        self.assertEqual(job.due, 1000020)
+
+    def test_unaligned(self):
+        job = self.timers.every(10, self._job('a'), 'a')
+        self.assertEqual(job.due, 1000013)
+
+    def test_advance(self):
+        job = self.timers.every(10, self._job('a'), 'a', align=True, advance=2)
+        self.assertEqual(job.due, 1000008)
+        # Already within the advance of the next aligned time
+        self.now = 1000009.0
+        job = self.timers.every(10, self._job('b'), 'b', align=True, advance=2)
+        self.assertEqual(job.due, 1000018)
+
+    def test_missed_runs_skipped(self):
+        job = self.timers.every(10, lambda: setattr(self, 'now', self.now + 25), 'slow',
+                align=True)
+        self.now = 1000010.0
+        self.timers.run_pending()
+        self.assertEqual(job.due, 1000040)
+        self.assertEqual(job.missed, 2)
+        self.assertEqual(self.timers.stats()['slow']['runs'], 1)
+
+    def test_due_order(self):
+        self.timers.every(10, self._job('ten'), 'ten', align=True)
+        self.timers.every(5, self._job('five'), 'five', align=True)
+        self.now = 1000010.0
+        self.timers.run_pending()
+        self.assertEqual([name for name, _ in self.ran], ['five', 'ten'])
+
+    def test_hourly_and_daily(self):
+        hourly = self.timers.hourly(self._job('h'), 'h')
+        daily = self.timers.daily('01:30', self._job('d'), 'd')
+        self.assertEqual(hourly.due % 3600, 0)
+        self.assertEqual(daily.due % 86400, 5400)
+        self.assertTrue(self.now < daily.due <= self.now + 86400)
+        self.now = daily.due + 1
+        self.timers.run_pending()
+        self.assertEqual(daily.due, self.now - 1 + 86400)
+
+    def test_clock_stepped_back(self):
+        job = self.timers.every(10, self._job('a'), 'a', align=True)
+        self.now -= 3600
+        self.assertEqual(self.timers.run_pending(), 7)
+        self.assertEqual(job.due, 1000010 - 3600)
+
+    def test_run_all(self):
+        self.timers.every(10, self._job('a'), 'a', align=True)
+        self.timers.every(60, self._job('b'), 'b', align=True)
+        self.now = 1000015.0
+        self.timers.run_all()
+        self.assertEqual([name for name, _ in self.ran], ['a', 'b'])
+        self.assertEqual(self.timers.run_pending(), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+'''Drift-free job scheduling for the SBCEye project
+
+provides:
+    Timers: a heap of timers, sleeps until the next job is due and keeps
+        jobs aligned to wall-clock multiples of their interval
+    PolledTimers: the same interface over the 'schedule' module, polled
+    scheduler(mode, poll): returns a Timers or PolledTimers for the mode
+'''
+
+# pragma pylint: disable=logging-fstring-interpolation
+
+import time
+import heapq
+import logging
+from itertools import count
+import schedule
+
+# Longest single sleep, seconds; bounds how long a wall clock step goes unnoticed
+MAX_WAIT = 60
+
+def scheduler(mode, poll=1):
+    '''A scheduler for the configured mode, 'timers' or 'schedule'
+    poll is the servicing interval (seconds) used by the 'schedule' mode'''
+    if mode == 'schedule':
+        return PolledTimers(poll)
+    return Timers()
+
+def _local_offset(when):
+    '''Seconds the local time zone is ahead of UTC at (when)'''
+    return time.localtime(when).tm_gmtoff
+
+class _Job:
+    '''A scheduled job and its lateness counters'''
+
+    def __init__(self, name, func, interval, align, offset, advance=0):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.align = align
+        self.advance = advance  # seconds before the aligned time to run at
+        self.offset = offset  # local time of day to run at (daily, hourly), or None
+        self.due = None
+        self.runs = 0
+        self.missed = 0
+        self.late = 0.0
+        self.late_max = 0.0
+        self.late_total = 0.0
+
+    def first(self, now):
+        '''The first time the job is due after (now)'''
+        if self.offset is not None:
+            shift = _local_offset(now) - self.offset
+            return ((now + shift) // self.interval + 1) * self.interval - shift
+        if self.align:
+            return ((now + self.advance) // self.interval + 1) * self.interval - self.advance
+        return now + self.interval
+
+    def next(self, now):
+        '''The next time the job is due after (now), following on from the
+        previous due time so that lateness does not accumulate'''
+        if self.offset is not None:
+            # Re-align, the local offset changes with daylight saving
+            return self.first(now)
+        due = self.due + self.interval
+        if due <= now:
+            # Overran, or the clock jumped forwards, skip the missed runs
+            skipped = int((now - due) // self.interval) + 1
+            self.missed += skipped
+            due += skipped * self.interval
+        return due
+
+    def stats(self):
+        '''Counters, as a dict'''
+        return {'runs': self.runs, 'missed': self.missed, 'late': self.late,
+                'late_max': self.late_max,
+                'late_mean': self.late_total / self.runs if self.runs else 0.0}
+
+class Timers:
+    '''Run jobs at fixed intervals from a heap of timers
+
+    Rather than polling, the scheduler sleeps until the earliest job is due.
+    Each run is scheduled from the previous due time, not from when the
+    previous run finished, so jobs do not drift. Aligned jobs run on
+    wall-clock multiples of their interval (eg every 10s at :00, :10, :20..),
+    runs missed by an overrun are skipped and counted. The lateness (start
+    time - due time) of every run is recorded per job.
+
+    provides:
+        every(interval, func, name, align, advance): run func() every (interval)
+            seconds, on multiples of the interval if align is True, or
+            (advance) seconds before them
+        hourly(func, name): run func() on the hour (local time)
+        daily(at, func, name): run func() daily at 'HH:MM' (local time)
+        run_pending(): run due jobs, returns seconds until the next is due
+        run_all(): run every job now, then carry on as scheduled
+        run(): service the jobs forever
+        stats(): returns a dict of the counters for each job, by name
+    '''
+
+    def __init__(self):
+        self.heap = []
+        self.jobs = []
+        self.order = count()
+
+    def _add(self, job):
+        '''Schedule a new job'''
+        job.due = job.first(time.time())
+        self.jobs.append(job)
+        heapq.heappush(self.heap, (job.due, next(self.order), job))
+        return job
+
+    def every(self, interval, func, name=None, align=False, advance=0):
+        '''Run func() every (interval) seconds'''
+        return self._add(_Job(name or func.__name__, func, interval, align, None, advance))
+
+    def hourly(self, func, name=None):
+        '''Run func() at the start of every hour'''
+        return self._add(_Job(name or func.__name__, func, 3600, True, 0))
+
+    def daily(self, at, func, name=None):
+        '''Run func() every day at (at), 'HH:MM' local time'''
+        (hours, minutes) = at.split(':')
+        return self._add(_Job(name or func.__name__, func, 86400, True,
+                int(hours) * 3600 + int(minutes) * 60))
+
+    def _reschedule(self, now):
+        '''Re-align all jobs after the clock was stepped backwards'''
+        logging.warning('System clock stepped backwards, re-aligning schedules')
+        self.heap = []
+        for job in self.jobs:
+            job.due = job.first(now)
+            heapq.heappush(self.heap, (job.due, next(self.order), job))
+
+    def run_pending(self):
+        '''Run any jobs that are due, in due order
+        returns seconds until the next job is due'''
+        now = time.time()
+        if self.heap and self.heap[0][0] - now > self.heap[0][2].interval:
+            self._reschedule(now)
+        while self.heap and self.heap[0][0] <= now:
+            (due, _, job) = heapq.heappop(self.heap)
+            job.late = now - due
+            job.late_max = max(job.late_max, job.late)
+            job.late_total += job.late
+            job.runs += 1
+            try:
+                job.func()
+            finally:
+                now = time.time()
+                job.due = job.next(now)
+                heapq.heappush(self.heap, (job.due, next(self.order), job))
+        if not self.heap:
+            return MAX_WAIT
+        return min(max(self.heap[0][0] - now, 0), MAX_WAIT)
+
+    def run_all(self):
+        '''Run every job now, then continue on their normal schedule'''
+        for job in list(self.jobs):
+            job.func()
+        now = time.time()
+        for job in self.jobs:
+            job.due = job.first(now)
+        self.heap = [(job.due, next(self.order), job) for job in self.jobs]
+        heapq.heapify(self.heap)
+
+    def run(self):
+        '''Service the jobs, does not return'''
+        while True:
+            time.sleep(self.run_pending())
+
+    def stats(self):
+        '''The lateness counters for each job'''
+        return {job.name: job.stats() for job in self.jobs}
+
+class PolledTimers:
+    '''The Timers interface over the 'schedule' module, which is polled
+    every (poll) seconds; jobs are not aligned and lateness is not recorded'''
+
+    def __init__(self, poll=1):
+        self.poll = poll
+        self.schedule = schedule.Scheduler()
+
+    def every(self, interval, func, name=None, align=False, advance=0):
+        '''Run func() every (interval) seconds, (align, advance) are not supported'''
+        del align, advance
+        return self.schedule.every(interval).seconds.do(func).tag(name or func.__name__)
+
+    def hourly(self, func, name=None):
+        '''Run func() at the start of every hour'''
+        return self.schedule.every().hour.at(':00').do(func).tag(name or func.__name__)
+
+    def daily(self, at, func, name=None):
+        '''Run func() every day at (at), 'HH:MM' local time'''
+        return self.schedule.every().day.at(at).do(func).tag(name or func.__name__)
+
+    def run_pending(self):
+        '''Run any jobs that are due, returns seconds until the next poll'''
+        self.schedule.run_pending()
+        return self.poll
+
+    def run_all(self):
+        '''Run every job now'''
+        self.schedule.run_all()
+
+    def run(self):
+        '''Service the jobs, does not return'''
+        while True:
+            time.sleep(self.run_pending())
+
+    def stats(self):
+        '''Lateness is not recorded'''
+        return {}
@@ -0,0 +1,138 @@
+'''Request timing and accounting for the SBCEye web server
+
+provides:
+    RequestStats: per-route latency histograms, bytes sent and phase times
+    TimedWriter: wraps a response file object, timing and counting writes
+    track(): start accounting phase times for the current request
+    untrack(token): stop accounting phase times for the current request
+    timed(phase): context manager, adds the time spent in it to a phase
+    add_time(phase, seconds): adds a time to a phase
+
+Phase times are kept in a context variable, so work done for a request on
+another thread (eg in the render pool) is accounted to that request as long
+as it is run in a copy of the requesting context.
+'''
+
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+# Latency histogram bucket upper bounds, seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Phases reported for each request
+#  queue: waiting for a render pool worker
+#  lock: waiting for the database lock
+#  flush: writing cached readings to the database
+#  render: rendering graphs and fetching series with rrdtool
+#  write: writing the response to the client
+PHASES = ('queue', 'lock', 'flush', 'render', 'write')
+
+_phases = ContextVar('sbceye_phases', default=None)
+
+def track():
+    '''Start accounting phases for the current request
+    returns (phases, token), pass token to untrack() when done'''
+    phases = dict.fromkeys(PHASES, 0.0)
+    return phases, _phases.set(phases)
+
+def untrack(token):
+    '''Stop accounting phases for the current request'''
+    _phases.reset(token)
+
+def add_time(phase, seconds):
+    '''Add to a phase of the current request, if it is being tracked'''
+    phases = _phases.get()
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+@contextmanager
+def timed(phase):
+    '''Add the time spent in the block to a phase of the current request'''
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        add_time(phase, time.monotonic() - start)
+
+class TimedWriter:
+    '''Wraps a (response) file object, counting the bytes written and
+    adding the time spent writing to the 'write' phase'''
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.sent = 0
+
+    def write(self, data):
+        '''Write data, timed and counted'''
+        with timed('write'):
+            written = self.wfile.write(data)
+        self.sent += len(data)
+        return written
+
+    def sendfile(self, out_fd, in_fd, offset, count):
+        '''Send (count) bytes from in_fd to the out_fd socket with
+        os.sendfile(), timed and counted as writes'''
+        with timed('write'):
+            while count > 0:
+                sent = os.sendfile(out_fd, in_fd, offset, count)
+                if sent == 0:
+                    break
+                offset += sent
+                count -= sent
+                self.sent += sent
+
+    def flush(self):
+        '''Flush the underlying file'''
+        self.wfile.flush()
+
+class RequestStats:
+    '''Accumulate request counts, latency histograms, bytes sent and phase
+    times for each route
+
+    provides:
+        begin(): note a request has started
+        end(route, elapsed, sent, phases): record a completed request
+        stats(): returns a copy of the counters, as a dict
+    '''
+
+    def __init__(self):
+        self.routes = {}
+        self.in_flight = 0
+        self.lock = Lock()
+
+    def begin(self):
+        '''A request has started'''
+        with self.lock:
+            self.in_flight += 1
+
+    def end(self, route, elapsed, sent, phases):
+        '''A request for route has finished, after (elapsed) seconds having
+        sent (sent) bytes, phases is a dict of phase: seconds'''
+        with self.lock:
+            self.in_flight -= 1
+            entry = self.routes.get(route)
+            if entry is None:
+                entry = {'count': 0, 'total': 0.0, 'max': 0.0, 'bytes': 0,
+                        'buckets': [0] * (len(BUCKETS) + 1),
+                        'phases': dict.fromkeys(PHASES, 0.0)}
+                self.routes[route] = entry
+            entry['count'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            entry['bytes'] += sent
+            entry['buckets'][bisect_left(BUCKETS, elapsed)] += 1
+            for phase, seconds in phases.items():
+                entry['phases'][phase] = entry['phases'].get(phase, 0.0) + seconds
+
+    def stats(self):
+        '''Return a copy of the counters'''
+        with self.lock:
+            return {
+                    'in_flight': self.in_flight,
+                    'routes': {route: dict(entry, buckets=list(entry['buckets']),
+                        phases=dict(entry['phases']))
+                        for route, entry in self.routes.items()},
+                    }
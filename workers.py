@@ -0,0 +1,50 @@
+'''Daemon thread pool for the SBCEye project
+
+provides:
+    Workers: an Executor whose worker threads do not hold up an exit
+'''
+
+from concurrent.futures import Executor, Future
+from queue import SimpleQueue
+from threading import Thread, Lock
+
+class Workers(Executor):
+    '''A pool of daemon worker threads, started as needed and then reused
+
+    Unlike ThreadPoolExecutor the workers are not joined at exit, so a long
+    lived event stream or a stuck data collector cannot hold up a shutdown.
+    A new worker is started whenever all the existing ones are busy, up to
+    the (workers) limit.
+    '''
+
+    def __init__(self, workers, prefix):
+        self.workers = workers
+        self.prefix = prefix
+        self.jobs = SimpleQueue()
+        self.threads = 0
+        self.pending = 0
+        self.lock = Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        self.jobs.put((future, fn, args, kwargs))
+        with self.lock:
+            self.pending += 1
+            if self.pending > self.threads and self.threads < self.workers:
+                self.threads += 1
+                Thread(target=self._work, name=f'{self.prefix}_{self.threads}',
+                        daemon=True).start()
+        return future
+
+    def _work(self):
+        while True:
+            (future, func, args, kwargs) = self.jobs.get()
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(func(*args, **kwargs))
+                    except BaseException as error:  # pylint: disable=broad-except
+                        future.set_exception(error)
+            finally:
+                with self.lock:
+                    self.pending -= 1